@@ -0,0 +1,197 @@
+# batch.py
+# Nạp file hàng loạt không cần UI (CLI + watch folder) — dùng chung pipeline với app (ingest.py)
+#
+# Lưu ý:
+# - Parse + map nhiều file song song (process pool); GHI tuần tự theo thứ tự file => kết quả xác định
+# - Logistics: file sau ghi đè file trước theo từng ô (last-write-wins theo PI), ô trống không ghi đè;
+#   mỗi file 1 transaction + cập nhật "Latest update S4" như nút Run Import Logistics
+# - File đã xử lý (theo hash nội dung, bảng imported_files; kể cả file lỗi) bị bỏ qua; --force để nạp lại
+# - Thứ tự trong 1 thư mục: thời gian sửa file (mtime) rồi tới tên file
+# - --all-sheets: đọc mọi sheet của workbook (ghép theo thứ tự sheet, sheet không map được bị bỏ qua)
+# - APP_PERF_LOG=perf.jsonl => mỗi file ghi 1 dòng perf (thời gian từng bước + dòng/s)
+#
+# python batch.py logistics FILE_OR_DIR... [--db data.db] [--workers N] [--force] [--all-sheets]
+# python batch.py projects  FILE_OR_DIR... [--db data.db] [--workers N] [--force]
+# python batch.py watch DIR [--db data.db] [--kind logistics] [--interval 10] [--settle 5] [--once] [--all-sheets]
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from pathlib import Path
+
+import perf
+from db import DB_PATH, LATEST_UPDATE_S4_FORMAT, ConnectionPool, set_latest_update_s4
+from ingest import apply_logistics, import_projects, read_mapped_many
+
+FILE_SUFFIXES = (".csv", ".xlsx")
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+WATCH_INTERVAL_S = 10
+WATCH_SETTLE_S = 5       # file phải "đứng yên" N giây (đang copy dở => chưa nạp)
+
+
+def collect_files(paths) -> list[Path]:
+    # file: giữ nguyên thứ tự truyền vào; thư mục: các file CSV/XLSX bên trong theo (mtime, tên)
+    out = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files = [
+                f for f in p.iterdir()
+                if f.is_file() and f.suffix.lower() in FILE_SUFFIXES and not f.name.startswith(("~$", "."))
+            ]
+            out.extend(sorted(files, key=lambda f: (f.stat().st_mtime, f.name)))
+        else:
+            out.append(p)
+    return out
+
+def file_hash(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _parse_job(path: Path, kind: str, all_sheets: bool = False):
+    # chạy trong process con: trả (frame, None, giây parse) | (None, lỗi, giây parse)
+    t0 = time.perf_counter()
+    try:
+        return read_mapped_many([path], kind, all_sheets, workers=1), None, time.perf_counter() - t0
+    except Exception as e:
+        return None, str(e), time.perf_counter() - t0
+
+def parse_files(paths: list[Path], kind: str, workers: int = DEFAULT_WORKERS, all_sheets: bool = False):
+    # generator (frame, lỗi, giây parse) đúng thứ tự paths; các file parse song song
+    if workers <= 1 or len(paths) <= 1:
+        for p in paths:
+            yield _parse_job(p, kind, all_sheets)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as ex:
+        yield from ex.map(_parse_job, paths, repeat(kind), repeat(all_sheets))
+
+def apply_frame(conn, kind: str, frame) -> dict:
+    # gọi bên trong pool.write()
+    if kind == "logistics":
+        stats = apply_logistics(conn, frame)
+        set_latest_update_s4(conn, datetime.now().strftime(LATEST_UPDATE_S4_FORMAT))
+        return stats
+    ids, rejected = import_projects(conn, frame)
+    return {"created": len(ids), "rejected": len(rejected)}
+
+def already_imported(pool: ConnectionPool, digest: str, kind: str) -> bool:
+    with pool.read() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM imported_files WHERE file_hash=? AND kind=?", (digest, kind)
+        ).fetchone()
+    return row is not None
+
+def record_file(conn, digest: str, kind: str, name: str, status: str, message: str | None):
+    conn.execute("""
+        INSERT OR REPLACE INTO imported_files(file_hash, kind, file_name, status, message, imported_at)
+        VALUES (?,?,?,?,?,?)
+    """, (digest, kind, name, status, message, datetime.now().strftime("%Y-%m-%d %H:%M")))
+
+def ingest_files(pool: ConnectionPool, paths, kind: str, workers: int = DEFAULT_WORKERS,
+                 force: bool = False, log=print, hashes: dict | None = None, all_sheets: bool = False) -> list[dict]:
+    # trả 1 dict / file: {"file", "status": ok|error|skipped, ...thống kê}
+    # hashes: memo (path, size, mtime) -> hash, để watch không hash lại file cũ mỗi vòng
+    results, todo = [], []
+    for p in collect_files(paths):
+        try:
+            st = p.stat()
+            memo_key = (str(p), st.st_size, st.st_mtime)
+            digest = hashes.get(memo_key) if hashes is not None else None
+            if digest is None:
+                digest = file_hash(p)
+                if hashes is not None:
+                    hashes[memo_key] = digest
+        except OSError as e:
+            # sai đường dẫn / không đọc được: báo lỗi file này, các file khác vẫn chạy (chưa có hash => không ghi imported_files)
+            res = {"file": str(p), "status": "error", "message": e.strerror or str(e)}
+            results.append(res)
+            log(format_result(res))
+            continue
+        if not force and already_imported(pool, digest, kind):
+            results.append({"file": p.name, "status": "skipped"})
+            continue
+        todo.append((p, digest))
+
+    for (p, digest), (frame, err, parse_s) in zip(todo, parse_files([p for p, _ in todo], kind, workers, all_sheets)):
+        if err is None and len(frame) == 0:
+            err = "File không có dữ liệu."
+        if err is not None:
+            with pool.write() as conn:
+                record_file(conn, digest, kind, p.name, "error", err)
+            res = {"file": p.name, "status": "error", "message": err}
+        else:
+            # ghi dữ liệu + đánh dấu file trong cùng 1 transaction
+            with perf.recording(f"batch {kind}", enabled=perf.PERF_LOG is not None, file=p.name) as rec:
+                if rec is not None:
+                    rec.add("parse", f"read {kind}", parse_s, len(frame))
+                with perf.stage("import", f"{kind} file", len(frame)), pool.write() as conn:
+                    stats = apply_frame(conn, kind, frame)
+                    record_file(conn, digest, kind, p.name, "ok", None)
+            res = {"file": p.name, "status": "ok", **stats}
+        results.append(res)
+        log(format_result(res))
+    return results
+
+def format_result(res: dict) -> str:
+    extra = " ".join(f"{k}={v}" for k, v in res.items() if k not in ("file", "status"))
+    return f"[{res['status']}] {res['file']} {extra}".rstrip()
+
+def watch_folder(pool: ConnectionPool, folder, kind: str = "logistics", interval: float = WATCH_INTERVAL_S,
+                 settle: float = WATCH_SETTLE_S, workers: int = DEFAULT_WORKERS, once: bool = False, log=print,
+                 all_sheets: bool = False):
+    # quét thư mục định kỳ; file mới (hoặc nội dung đổi) => nạp theo thứ tự (mtime, tên)
+    hashes = {}
+    while True:
+        now = time.time()
+        ready = [p for p in collect_files([folder]) if now - p.stat().st_mtime >= settle]
+        if ready:
+            ingest_files(pool, ready, kind, workers=workers, log=log, hashes=hashes, all_sheets=all_sheets)
+        if once:
+            return
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # option chung khai báo ở từng lệnh con => đặt sau tên lệnh như usage ở đầu file
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default=DB_PATH)
+    common.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="số process parse file song song")
+    ap = argparse.ArgumentParser(description="Nạp file CSV/XLSX vào data.db không cần UI")
+    sub = ap.add_subparsers(dest="command", required=True)
+    for kind in ("logistics", "projects"):
+        p = sub.add_parser(kind, parents=[common], help=f"nạp file {kind} (file hoặc thư mục)")
+        p.add_argument("paths", nargs="+")
+        p.add_argument("--force", action="store_true", help="nạp lại cả file đã nạp")
+        p.add_argument("--all-sheets", action="store_true", help="đọc mọi sheet của file Excel (mặc định: sheet đầu)")
+    w = sub.add_parser("watch", parents=[common], help="theo dõi thư mục, nạp file mới")
+    w.add_argument("folder")
+    w.add_argument("--kind", choices=["logistics", "projects"], default="logistics")
+    w.add_argument("--interval", type=float, default=WATCH_INTERVAL_S)
+    w.add_argument("--settle", type=float, default=WATCH_SETTLE_S)
+    w.add_argument("--once", action="store_true", help="quét 1 lần rồi thoát")
+    w.add_argument("--all-sheets", action="store_true", help="đọc mọi sheet của file Excel (mặc định: sheet đầu)")
+    args = ap.parse_args()
+
+    pool = ConnectionPool(args.db, read_size=1)
+    try:
+        if args.command == "watch":
+            print(f"Watching {args.folder} ({args.kind}) — Ctrl+C để dừng")
+            try:
+                watch_folder(pool, args.folder, args.kind, args.interval, args.settle, args.workers, args.once,
+                             all_sheets=args.all_sheets)
+            except KeyboardInterrupt:
+                pass
+        else:
+            results = ingest_files(pool, args.paths, args.command, workers=args.workers, force=args.force,
+                                   all_sheets=args.all_sheets)
+            n = {s: sum(r["status"] == s for r in results) for s in ("ok", "error", "skipped")}
+            print(f"Done: {n['ok']} ok, {n['error']} error, {n['skipped']} skipped")
+    finally:
+        pool.close()
@@ -0,0 +1,321 @@
+# bench.py
+# Benchmark các đường nóng của app + sinh dữ liệu giả lập giống thật
+#
+# python bench.py [--sizes 1000,10000,100000,500000] [--repeat 3] [--only tab1,logistics] [--out bench.jsonl] [--seed 42]
+#
+# Lưu ý:
+# - Mỗi size 1 DB tạm riêng (xoá sau khi chạy); dữ liệu sinh theo --seed => chạy lại ra đúng dữ liệu cũ
+# - Dữ liệu: file dự án header tiếng Việt (~1% dòng lỗi), file logistics có PI trùng / sai hoa-thường /
+#   PI không tồn tại + ngày lẫn format (dd/mm/yyyy, yyyy-mm-dd, serial Excel, datetime, ô trống), status log
+# - Output JSON lines (1 dòng / benchmark / size) ra stdout và nối vào --out => so sánh giữa các commit
+# - seconds = median của --repeat lần (insert chỉ chạy 1 lần vì làm DB lớn dần); setup không tính giờ
+
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db import ConnectionPool
+from ingest import (
+    apply_logistics, import_projects, map_add_project_columns, map_import_logistics_columns,
+    normalize_date_cell, normalize_date_series, parse_paste_text, prepare_projects, read_mapped,
+)
+from jobs import JobRunner, get_jobs
+from queries import (
+    count_projects, fetch_projects_page, fetch_rollup_dim, fetch_rollup_totals, fetch_weekly_arrivals,
+    page_count,
+)
+from status import count_bulk_matches, fetch_bulk_preview
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 500_000]
+DEFAULT_REPEAT = 3
+GROUPS = ["insert", "paste", "tab1", "logistics", "dates", "bulk", "summary"]
+
+PROJECT_HEADERS = [
+    "DGW PIC", "ASUS PIC", "Part number", "Mã hàng", "Số lượng", "Đơn giá FV",
+    "Mail nhận đơn hàng từ Asus", "SI", "EU",
+]
+LOGISTICS_HEADERS = [
+    "Hợp đồng/ Số PO NK", "Bill of lading", "Ngày đến cảng", "Ngày đến kho",
+    "Ngày khởi hành", "Số tờ khai", "Số lô",
+]
+PEOPLE = ["Nguyễn Văn An", "Trần Thị Bình", "Lê Hoàng Cường", "Phạm Minh Dũng", "Hoàng Thu Hà", "Vũ Đức Long"]
+ASUS_PEOPLE = ["Alice Chen", "Kevin Lin", "Tony Wu", "Grace Huang"]
+SI_NAMES = [f"SI-{c}" for c in ("FPT", "CMC", "HPT", "MSB", "VNPT", "ELCOM", "SAMSUNG", "TMA")]
+EU_NAMES = [f"EU-{c}" for c in ("HN", "HCM", "DN", "HP", "CT", "BIDV", "VCB", "EVN", "VIETTEL")]
+STATUS_TEXTS = ["Đã đặt hàng", "Confirmed PI", "Hàng đi", "Đã cập cảng", "Đang thông quan", "Đã về kho", "Đã giao"]
+PI_GROUP = 3             # trung bình ~3 dòng dự án / PI
+BASE_DATE = datetime(2024, 1, 1)
+
+
+# ========= Sinh dữ liệu =========
+def gen_projects(n: int, rng: np.random.Generator) -> pd.DataFrame:
+    # file "Add Project — Import" header VN; ~1% dòng lỗi (thiếu Mã hàng / số lượng 0)
+    sku = pd.Series(rng.integers(0, max(10, n // 4), n)).map(lambda i: f"NB-{i:06d}")
+    df = pd.DataFrame({
+        "DGW PIC": rng.choice(PEOPLE, n),
+        "ASUS PIC": rng.choice(ASUS_PEOPLE, n),
+        "Part number": np.where(rng.random(n) < 0.3, "", pd.Series(rng.integers(0, 10**6, n)).map(lambda i: f"90NB{i:06d}")),
+        "Mã hàng": sku,
+        "Số lượng": rng.integers(1, 500, n),
+        "Đơn giá FV": rng.integers(1_000, 60_000, n) * 1000,
+        "Mail nhận đơn hàng từ Asus": np.where(rng.random(n) < 0.5, "orders@asus.com", ""),
+        "SI": rng.choice(SI_NAMES, n),
+        "EU": rng.choice(EU_NAMES, n),
+    }, columns=PROJECT_HEADERS)
+    bad = rng.random(n) < 0.01
+    df.loc[bad & (rng.random(n) < 0.5), "Mã hàng"] = ""
+    df.loc[bad & (df["Mã hàng"] != ""), "Số lượng"] = 0
+    return df
+
+def gen_paste_text(projects: pd.DataFrame) -> str:
+    # Paste: TSV đúng thứ tự cột đã lock, có dòng header
+    return projects.astype(str).to_csv(sep="\t", index=False)
+
+def _mixed_dates(n: int, rng: np.random.Generator) -> list:
+    days = rng.integers(0, 900, n)
+    kind = rng.integers(0, 5, n)
+    out = []
+    for d, k in zip(days.tolist(), kind.tolist()):
+        dt = BASE_DATE + timedelta(days=d)
+        if k == 0:
+            out.append(dt.strftime("%d/%m/%Y"))
+        elif k == 1:
+            out.append(dt.strftime("%Y-%m-%d"))
+        elif k == 2:
+            out.append((dt - datetime(1899, 12, 30)).days)    # serial Excel
+        elif k == 3:
+            out.append(dt)
+        else:
+            out.append(None)
+    return out
+
+def gen_logistics(n: int, n_pis: int, rng: np.random.Generator) -> pd.DataFrame:
+    # PI lấy có lặp (duplicate => last-write-wins), ~10% PI không có trong DB, hoa/thường + khoảng trắng lẫn lộn
+    pi_idx = rng.integers(0, max(1, int(n_pis * 1.1)), n)
+    pi = pd.Series(pi_idx).map(lambda i: f"PI-{i:07d}")
+    lower = rng.random(n) < 0.2
+    pi = pi.where(~lower, pi.str.lower())
+    pi = pi.where(rng.random(n) >= 0.1, " " + pi + " ")
+    n_bills = max(1, n // 50)
+    return pd.DataFrame({
+        "Hợp đồng/ Số PO NK": pi,
+        "Bill of lading": np.where(rng.random(n) < 0.2, None, pd.Series(rng.integers(0, n_bills, n)).map(lambda i: f"HLCU{i:08d}")),
+        "Ngày đến cảng": _mixed_dates(n, rng),
+        "Ngày đến kho": _mixed_dates(n, rng),
+        "Ngày khởi hành": _mixed_dates(n, rng),
+        "Số tờ khai": np.where(rng.random(n) < 0.3, None, pd.Series(rng.integers(10**11, 10**12, n)).astype(str)),
+        "Số lô": np.where(rng.random(n) < 0.3, None, pd.Series(rng.integers(0, max(1, n // 20), n)).map(lambda i: f"LOT{i:05d}")),
+    }, columns=LOGISTICS_HEADERS)
+
+def assign_pis(conn):
+    # ~PI_GROUP dòng dự án / PI (như đơn thật: 1 PI nhiều mã hàng)
+    conn.execute(f"UPDATE projects SET pi_no = printf('PI-%07d', (rowid - 1) / {PI_GROUP})")
+
+def gen_status_logs(conn, rng: np.random.Generator, per_project: float = 1.5):
+    # status log cho ~một nửa số dự án; trigger giữ project_current_status
+    ids = [r[0] for r in conn.execute("SELECT project_id FROM projects")]
+    n = int(len(ids) * per_project)
+    if n == 0:
+        return 0
+    pick = rng.integers(0, len(ids) // 2 + 1, n).clip(max=len(ids) - 1)
+    minutes = rng.integers(0, 900 * 24 * 60, n)
+    rows = [
+        (ids[p], STATUS_TEXTS[int(s)], None, "PM", (BASE_DATE + timedelta(minutes=int(m))).strftime("%Y-%m-%d %H:%M"))
+        for p, s, m in zip(pick.tolist(), rng.integers(0, len(STATUS_TEXTS), n).tolist(), minutes.tolist())
+    ]
+    conn.executemany(
+        "INSERT INTO status_logs(project_id,status_text,note,updated_by,updated_at) VALUES (?,?,?,?,?)", rows
+    )
+    return n
+
+
+# ========= Đo =========
+def timed(fn, repeat: int, setup=None) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+class Recorder:
+    def __init__(self, out_path: str | None):
+        self.out_path = out_path
+        self.meta = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pandas": pd.__version__,
+            "ts": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def add(self, bench: str, size: int, rows: int, times: list[float], **extra):
+        # extra: số đo thêm của riêng benchmark (vd mb = bộ nhớ frame)
+        med = statistics.median(times)
+        rec = {
+            "bench": bench, "size": size, "rows": rows, "runs": len(times),
+            "seconds": round(med, 6), "min": round(min(times), 6),
+            "rows_per_s": round(rows / med, 1) if med > 0 else None,
+            **extra, **self.meta,
+        }
+        line = json.dumps(rec, ensure_ascii=False)
+        print(line, flush=True)
+        if self.out_path:
+            with open(self.out_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def run_size(n: int, repeat: int, groups: list[str], rng: np.random.Generator, rec: Recorder, workdir: str):
+    pool = ConnectionPool(os.path.join(workdir, f"bench_{n}.db"))
+    projects = gen_projects(n, rng)
+    try:
+        # --- insert (gen_project_ids + executemany); luôn chạy vì các bench sau cần dữ liệu ---
+        mapped = map_add_project_columns(projects)
+        mapped.index = mapped.index + 2
+        t0 = time.perf_counter()
+        with pool.write() as conn:
+            ids, _ = import_projects(conn, mapped)
+        t_insert = time.perf_counter() - t0
+        if "insert" in groups:
+            rec.add("insert_projects", n, len(ids), [t_insert])
+        with pool.write() as conn:
+            assign_pis(conn)
+            gen_status_logs(conn, rng)
+        with pool.write() as conn:
+            conn.execute("ANALYZE")
+
+        if "paste" in groups:
+            txt = gen_paste_text(projects)
+            rec.add("paste_parse", n, n, timed(lambda: prepare_projects(parse_paste_text(txt)[0]), repeat))
+
+        if "tab1" in groups:
+            n_pages = page_count(n, 100)
+            cases = {
+                "tab1_page_first": ({}, None, None, 1),
+                "tab1_page_last": ({}, None, None, n_pages),
+                "tab1_filter_si": ({"si": "FPT"}, None, None, 1),
+                "tab1_filter_multi": ({"si": "FPT", "eu": "HN", "dgw_pic": "An"}, None, None, 1),
+                "tab1_filter_short": ({"sku_code": "12"}, None, None, 1),
+                "tab1_search_all": ({}, "NB-0001", None, 1),
+                "tab1_status_filter": ({"current_status": "về kho"}, None, None, 1),
+            }
+            # tab1_date_range: đo sau khi merge logistics (lúc đó mới có ngày S4)
+            for name, (filters, search, dates, page) in cases.items():
+                def load(filters=filters, search=search, dates=dates, page=page):
+                    with pool.read() as conn:
+                        count_projects(conn, filters, search, dates)
+                        fetch_projects_page(conn, filters, page, 100, search, dates)
+                rec.add(name, n, 100, timed(load, repeat))
+
+        if "logistics" in groups:
+            raw = gen_logistics(n, -(-n // PI_GROUP), rng)
+            path = os.path.join(workdir, f"logistics_{n}.csv")
+            raw.to_csv(path, index=False)
+            rec.add("logistics_parse_csv", n, n, timed(lambda: read_mapped(path, "logistics"), repeat))
+
+            def reset():
+                with pool.write() as conn:
+                    conn.execute("""UPDATE projects SET bill_no=NULL, lot_no=NULL, declaration_no=NULL,
+                                    s4_in_warehouse_date=NULL, s4_arrival_port_date=NULL, s4_departure_date=NULL""")
+
+            def merge():
+                with pool.write() as conn:
+                    apply_logistics(conn, map_import_logistics_columns(raw))
+            rec.add("logistics_map_merge", n, n, timed(merge, repeat, setup=reset))
+
+            if "tab1" in groups:
+                def load_dates():
+                    dates = {"s4_in_warehouse_date": ("2024-03-01", "2024-03-31")}
+                    with pool.read() as conn:
+                        count_projects(conn, {}, None, dates)
+                        fetch_projects_page(conn, {}, 1, 100, None, dates)
+                rec.add("tab1_date_range", n, 100, timed(load_dates, repeat))
+
+        if "dates" in groups:
+            values = pd.Series(_mixed_dates(n, rng), dtype=object)
+            rec.add("normalize_date_cell", n, n, timed(lambda: [normalize_date_cell(v) for v in values], repeat))
+            rec.add("normalize_date_series", n, n, timed(lambda: normalize_date_series(values), repeat))
+
+        if "bulk" in groups:
+            # Bill nhiều dòng nhất (1 chuyến tàu); chưa chạy nhóm logistics => gán Bill giả (~2% dòng / Bill)
+            with pool.read() as conn:
+                has_bill = conn.execute("SELECT 1 FROM projects WHERE bill_no IS NOT NULL LIMIT 1").fetchone()
+            if not has_bill:
+                with pool.write() as conn:
+                    conn.execute("UPDATE projects SET bill_no = printf('HLCU%08d', rowid % 50)")
+            with pool.read() as conn:
+                bill = conn.execute(
+                    "SELECT bill_no FROM projects WHERE bill_no IS NOT NULL GROUP BY bill_no ORDER BY COUNT(*) DESC LIMIT 1"
+                ).fetchone()[0]
+            filters = {"bill_no": bill}
+            with pool.read() as conn:
+                matched = count_bulk_matches(conn, filters)
+
+            job_ids = []
+
+            def bulk():
+                # preview như C2 rồi chạy đúng job của app (chunk + checkpoint), đợi job xong
+                with pool.read() as conn:
+                    count_bulk_matches(conn, filters)
+                    fetch_bulk_preview(conn, filters)
+                runner = JobRunner(pool, jobs_dir=workdir)
+                job_ids.append(runner.submit_bulk_status(filters, "Đã cập cảng", None, "PM", matched))
+                runner.shutdown()
+            rec.add("bulk_status", n, matched, timed(bulk, repeat))
+            with pool.read() as conn:
+                failed = [j for j in get_jobs(conn, job_ids) if j["status"] != "done"]
+            if failed:
+                raise RuntimeError(f"bulk_status job lỗi: {failed[0]['message']}")
+
+        if "summary" in groups:
+            # tab Summary: chỉ đọc bảng rollup => thời gian không đổi theo n
+            def summary():
+                with pool.read() as conn:
+                    fetch_rollup_totals(conn)
+                    fetch_rollup_dim(conn, "si")
+                    fetch_weekly_arrivals(conn, None)
+            rec.add("summary_read", n, n, timed(summary, repeat))
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Benchmark các đường nóng (dữ liệu giả lập)")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    ap.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    ap.add_argument("--only", default=",".join(GROUPS), help=f"nhóm cần chạy: {', '.join(GROUPS)}")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=None, help="nối kết quả (JSON lines) vào file này")
+    args = ap.parse_args()
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        sys.exit(f"Nhóm không hợp lệ: {', '.join(sorted(unknown))}")
+    rec = Recorder(args.out)
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        for n in (int(s) for s in args.sizes.split(",")):
+            # seed riêng theo size => thêm/bớt size không đổi dữ liệu của size khác
+            run_size(n, args.repeat, groups, np.random.default_rng([args.seed, n]), rec, workdir)
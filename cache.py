@@ -0,0 +1,183 @@
+# cache.py
+# Cache dùng chung mọi session (đặt trong st.cache_resource ở app)
+#
+# Lưu ý:
+# - LRU giới hạn theo BYTE (ước lượng memory_usage(deep=True) của DataFrame), không theo số entry
+# - Giá trị trong cache dùng chung giữa các session => KHÔNG được sửa tại chỗ (copy trước nếu cần)
+# - QueryCache: kết quả đọc DB hết hạn theo pool.data_version() (mọi pool.write() commit đều tăng version)
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import perf
+from ingest import MAPPING_VERSION, PREVIEW_ROWS, iter_mapped_chunks, iter_mapped_chunks_many
+
+UPLOAD_CACHE_MAX_BYTES = 512 * 1024 * 1024    # 512MB tổng
+UPLOAD_ENTRY_MAX_FRACTION = 4                 # 1 file tối đa 1/4 cache; lớn hơn => chỉ giữ preview, Run sẽ stream
+QUERY_CACHE_MAX_BYTES = 128 * 1024 * 1024     # 128MB kết quả query
+
+
+class LRUCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: OrderedDict = OrderedDict()
+        self._sizes: dict = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value, nbytes: int):
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key)
+                del self._data[key]
+            if nbytes > self.max_bytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = nbytes
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                old, _ = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(old)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def frame_nbytes(df: pd.DataFrame | None) -> int:
+    return 0 if df is None else int(df.memory_usage(index=True, deep=True).sum())
+
+
+# ========= Upload parse cache =========
+# key = hash nội dung file + loại mapping + MAPPING_VERSION
+# value = {"preview": N dòng đầu đã map, "frame": cả file đã map | None (file quá lớn)}
+# kind: xem ingest.IMPORT_KINDS
+
+
+class UploadCache:
+    def __init__(self, max_bytes: int = UPLOAD_CACHE_MAX_BYTES):
+        self.frames = LRUCache(max_bytes)
+        self.entry_max_bytes = max_bytes // UPLOAD_ENTRY_MAX_FRACTION
+        # file_id (mỗi lần upload) -> hash: không phải hash lại bytes mỗi rerun
+        self._hashes = LRUCache(max_bytes=4096)
+
+    def key(self, uploaded, kind: str) -> tuple:
+        file_id = getattr(uploaded, "file_id", None)
+        digest = self._hashes.get(file_id) if file_id is not None else None
+        if digest is None:
+            digest = hashlib.blake2b(uploaded.getvalue(), digest_size=16).hexdigest()
+            if file_id is not None:
+                self._hashes.put(file_id, digest, 1)
+        return (digest, kind, MAPPING_VERSION)
+
+    def get_parsed(self, uploaded, kind: str) -> dict:
+        # parse + map 1 lần / file; rerun sau lấy từ cache
+        key = self.key(uploaded, kind)
+        entry = self.frames.get(key)
+        if entry is None:
+            entry = self._parse(uploaded, kind)
+            self.frames.put(key, entry, frame_nbytes(entry["preview"]) + frame_nbytes(entry["frame"]))
+        return entry
+
+    def get_parsed_many(self, uploads: list, kind: str, all_sheets: bool = False) -> dict:
+        # nhiều file / mọi sheet: ghép theo thứ tự upload; "rows" = tổng số dòng đã map
+        # quá lớn => chỉ giữ preview (như get_parsed), Run sẽ stream lại các file (JobRunner.submit_files)
+        key = (tuple(self.key(u, kind) for u in uploads), all_sheets)
+        entry = self.frames.get(key)
+        if entry is None:
+            entry = self._parse_many(uploads, kind, all_sheets)
+            self.frames.put(key, entry, frame_nbytes(entry["preview"]) + frame_nbytes(entry["frame"]))
+        return entry
+
+    def _parse(self, uploaded, kind: str) -> dict:
+        parts, size = [], 0
+        # thiếu cột bắt buộc => ValueError, không cache
+        for mapped in iter_mapped_chunks(uploaded, kind):
+            parts.append(mapped)
+            size += frame_nbytes(mapped)
+            if size > self.entry_max_bytes:
+                # quá lớn để giữ trong RAM: chỉ giữ preview, Run sẽ stream lại file
+                return {"preview": parts[0].head(PREVIEW_ROWS), "frame": None}
+        if not parts:
+            return {"preview": pd.DataFrame(), "frame": pd.DataFrame()}
+        frame = pd.concat(parts) if len(parts) > 1 else parts[0]
+        return {"preview": frame.head(PREVIEW_ROWS), "frame": frame}
+
+
+    def _parse_many(self, uploads: list, kind: str, all_sheets: bool) -> dict:
+        # streaming như _parse (RAM ~ 1 chunk sau khi vượt ngưỡng), nhưng đọc hết để đếm "rows"
+        # và để file / sheet lỗi header báo ngay lúc preview thay vì giữa job
+        parts, size, rows, preview = [], 0, 0, None
+        for mapped in iter_mapped_chunks_many(uploads, kind, all_sheets):
+            if preview is None:
+                preview = mapped.head(PREVIEW_ROWS)
+            rows += len(mapped)
+            if parts is not None:
+                parts.append(mapped)
+                size += frame_nbytes(mapped)
+                if size > self.entry_max_bytes:
+                    parts = None
+        if preview is None:
+            return {"preview": pd.DataFrame(), "frame": pd.DataFrame(), "rows": 0}
+        if parts is None:
+            return {"preview": preview, "frame": None, "rows": rows}
+        frame = pd.concat(parts) if len(parts) > 1 else parts[0]
+        return {"preview": frame.head(PREVIEW_ROWS), "frame": frame, "rows": rows}
+
+
+# ========= Query result cache =========
+# key = (hàm đọc, tham số); value = (data_version lúc đọc, kết quả)
+# rerun chỉ đổi UI (mở expander, bấm tab...) => trả từ RAM, không query lại SQLite
+def _freeze(value):
+    # dict/list (vd filters) -> tuple để làm key
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class QueryCache:
+    def __init__(self, pool, max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.pool = pool
+        self.results = LRUCache(max_bytes)
+
+    def call(self, fn, *args, **kwargs):
+        # fn(conn, *args, **kwargs) chạy trên connection đọc của pool
+        key = (fn.__module__, fn.__qualname__, _freeze(args), _freeze(kwargs))
+        with perf.stage("query", fn.__qualname__) as s:
+            # lấy version TRƯỚC khi query: có ghi chen giữa => entry mang version cũ, lần sau đọc lại
+            version = self.pool.data_version()
+            hit = self.results.get(key)
+            if hit is not None and hit[0] == version:
+                s.kind = "cache"
+                return hit[1]
+            with self.pool.read() as conn:
+                value = fn(conn, *args, **kwargs)
+            if isinstance(value, pd.DataFrame):
+                s.rows = len(value)
+            nbytes = frame_nbytes(value) if isinstance(value, pd.DataFrame) else 64
+            self.results.put(key, (version, value), nbytes)
+            return value
+
+    def clear(self):
+        self.results.clear()
@@ -0,0 +1,609 @@
+# db.py
+# Lớp kết nối SQLite dùng chung cho cả process (mọi rerun + mọi session Streamlit)
+#
+# Lưu ý:
+# - Schema init đúng 1 lần khi mở pool (không chạy lại CREATE TABLE mỗi rerun)
+# - journal_mode=WAL + synchronous=NORMAL: viewer đọc song song khi editor đang import
+# - 1 connection GHI (khoá Lock, BEGIN IMMEDIATE, commit/rollback tự động)
+#   + N connection ĐỌC (query_only) lấy từ pool
+# - Dùng file DB thật; ":memory:" không chia sẻ được giữa các connection
+# - data_version(): đổi sau mỗi lần ghi (write() commit) hoặc khi process khác ghi vào DB
+#   => cache kết quả đọc (cache.QueryCache) biết khi nào hết hạn
+# - submit(fn, ...): xếp hàng cho writer thread, trả Future (kết quả có sau khi COMMIT)
+#   writer thread gộp mọi thao tác nhỏ đang chờ (từ mọi session) vào 1 transaction = 1 lần fsync (group commit);
+#   mỗi thao tác 1 SAVEPOINT => 1 thao tác lỗi không kéo theo các thao tác khác trong nhóm
+#   submit_exclusive(): 1 transaction riêng (chunk import lớn), không gộp
+
+import contextvars
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import Empty, Queue
+from sqlite3 import Connection
+from typing import Iterator
+
+from perf import TimedConnection
+
+DB_PATH = "data.db"
+
+READ_POOL_SIZE = 4
+BUSY_TIMEOUT_S = 5.0
+MMAP_SIZE = 256 * 1024 * 1024      # 256MB
+CACHE_SIZE_KB = 64 * 1024          # 64MB / connection (PRAGMA cache_size âm = KiB)
+GROUP_COMMIT_MAX_OPS = 256         # số thao tác tối đa gộp vào 1 transaction
+
+
+def _casefold(s):
+    # LIKE của SQLite chỉ bỏ qua hoa/thường với ASCII ("BÌ" không khớp "Bình") => so khớp qua casefold()
+    return s.casefold() if isinstance(s, str) else s
+
+def _connect(path: str, readonly: bool) -> Connection:
+    # isolation_level=None: tự quản transaction (BEGIN IMMEDIATE ở write())
+    # TimedConnection: đo thời gian từng câu khi đang bật perf (xem perf.py); tắt => như Connection thường
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=BUSY_TIMEOUT_S,
+                           factory=TimedConnection)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.create_function("casefold", 1, _casefold, deterministic=True)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON;")
+    return conn
+
+
+def init_db(conn: Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS projects(
+        project_id     TEXT PRIMARY KEY,
+        dgw_pic        TEXT NOT NULL,
+        asus_pic       TEXT NOT NULL,
+        partnumber     TEXT,               -- optional
+        sku_code       TEXT NOT NULL,      -- Mã hàng
+        qty            INTEGER NOT NULL,
+        price_vnd      REAL NOT NULL,
+        asus_order_email TEXT,             -- optional
+        si             TEXT NOT NULL,
+        eu             TEXT NOT NULL,
+        pi_no          TEXT,               -- có thể bổ sung/đổi qua Quick PI
+        bill_no        TEXT,
+        lot_no         TEXT,
+        declaration_no TEXT,
+        s4_in_warehouse_date TEXT,         -- dd/mm/yyyy
+        s4_arrival_port_date TEXT,         -- dd/mm/yyyy
+        s4_departure_date TEXT,            -- dd/mm/yyyy
+        row_created_at TEXT NOT NULL
+    );
+    """)
+    # Tab 1 sort mặc định theo Last updated => ORDER BY ... LIMIT đi theo index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(row_created_at)")
+    # PI chuẩn hoá (strip + upper) để Import Logistics match theo index thay vì quét bảng
+    # (SQLite không dùng index biểu thức cho join => cột generated VIRTUAL + index thường)
+    add_column_if_missing(conn, "projects", "pi_key", "TEXT GENERATED ALWAYS AS (upper(trim(pi_no))) VIRTUAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_pi_key ON projects(pi_key)")
+    # Ngày S4 lưu dd/mm/yyyy (hiển thị) => cột ISO yyyy-mm-dd generated để filter/sort theo khoảng ngày bằng index
+    # (cột generated tự có giá trị khi ghi; CREATE INDEX lần đầu = backfill data.db cũ)
+    for col, iso_col in S4_DATE_COLUMNS.items():
+        add_column_if_missing(conn, "projects", iso_col, f"TEXT GENERATED ALWAYS AS ({dmy_to_iso_sql(col)}) VIRTUAL")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_projects_{iso_col} ON projects({iso_col})")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS status_logs(
+        log_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id  TEXT NOT NULL,
+        status_text TEXT NOT NULL,
+        note        TEXT,
+        updated_by  TEXT NOT NULL,
+        updated_at  TEXT NOT NULL,
+        FOREIGN KEY(project_id) REFERENCES projects(project_id) ON DELETE CASCADE
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS settings(
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """)
+    init_current_status(conn)
+    # file đã nạp bởi CLI batch / watch folder (key = hash nội dung => file trùng không nạp lại)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS imported_files(
+        file_hash   TEXT NOT NULL,
+        kind        TEXT NOT NULL,
+        file_name   TEXT NOT NULL,
+        status      TEXT NOT NULL,     -- ok | error
+        message     TEXT,
+        imported_at TEXT NOT NULL,
+        PRIMARY KEY(file_hash, kind)
+    );
+    """)
+    # job chạy nền (jobs.py): import file / bulk status; checkpoint để chạy tiếp sau khi process dừng giữa chừng
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs(
+        job_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind        TEXT NOT NULL,                -- projects | logistics | bulk_status
+        status      TEXT NOT NULL,                -- queued | running | done | error
+        source_name TEXT,                         -- tên file upload
+        source_path TEXT,                         -- bản lưu trên đĩa (để resume)
+        params      TEXT,                         -- JSON
+        total_rows  INTEGER,
+        done_rows   INTEGER NOT NULL DEFAULT 0,
+        checkpoint  INTEGER NOT NULL DEFAULT 0,   -- file: số chunk đã commit; bulk: rowid projects cuối đã ghi
+        elapsed_s   REAL NOT NULL DEFAULT 0,
+        result      TEXT,                         -- JSON
+        message     TEXT,
+        created_at  TEXT NOT NULL,
+        finished_at TEXT
+    );
+    """)
+    init_sequences(conn)
+    init_fts(conn)
+    init_rollups(conn)
+
+
+# ========= Current status =========
+# status_logs append-only => trạng thái mới nhất / dự án giữ sẵn trong project_current_status
+# - trigger AFTER INSERT cập nhật (mới nhất theo updated_at; bằng nhau => log ghi sau thắng)
+# - Tab 1 đọc theo PRIMARY KEY, không groupby cả bảng log
+def init_current_status(conn: Connection):
+    # lịch sử 1 dự án (lazy) đi theo index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_status_logs_project ON status_logs(project_id, updated_at)")
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='project_current_status'").fetchone()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS project_current_status(
+        project_id  TEXT PRIMARY KEY,
+        log_id      INTEGER NOT NULL,
+        status_text TEXT NOT NULL,
+        note        TEXT,
+        updated_by  TEXT NOT NULL,
+        updated_at  TEXT NOT NULL,
+        FOREIGN KEY(project_id) REFERENCES projects(project_id) ON DELETE CASCADE
+    );
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS status_logs_current_ai AFTER INSERT ON status_logs BEGIN
+        INSERT INTO project_current_status(project_id, log_id, status_text, note, updated_by, updated_at)
+        VALUES (new.project_id, new.log_id, new.status_text, new.note, new.updated_by, new.updated_at)
+        ON CONFLICT(project_id) DO UPDATE SET
+            log_id=excluded.log_id, status_text=excluded.status_text, note=excluded.note,
+            updated_by=excluded.updated_by, updated_at=excluded.updated_at
+        WHERE excluded.updated_at >= project_current_status.updated_at;
+    END;
+    """)
+    # data.db cũ (đã có log trước khi có bảng này) => backfill 1 lần
+    if not existed:
+        rebuild_current_status(conn)
+
+def rebuild_current_status(conn: Connection):
+    conn.execute("DELETE FROM project_current_status")
+    conn.execute("""
+    INSERT INTO project_current_status(project_id, log_id, status_text, note, updated_by, updated_at)
+    SELECT project_id, log_id, status_text, note, updated_by, updated_at
+    FROM (
+        SELECT *, row_number() OVER (PARTITION BY project_id ORDER BY updated_at DESC, log_id DESC) AS rn
+        FROM status_logs
+    ) WHERE rn = 1
+    """)
+
+
+# ========= FTS (trigram) =========
+# Index substring cho các cột filter "contains" (Tab 1 + C2 Bulk)
+# - external content: dữ liệu nằm ở projects, FTS chỉ giữ index; đồng bộ bằng trigger
+# - map theo rowid của projects => sau VACUUM (rowid có thể đổi) cần chạy rebuild-fts
+FTS_COLUMNS = [
+    "si", "eu", "dgw_pic", "asus_pic", "sku_code",
+    "partnumber", "pi_no", "lot_no", "bill_no", "declaration_no",
+]
+
+def init_fts(conn: Connection):
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='projects_fts'").fetchone()
+    cols = ", ".join(FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(
+        {cols},
+        content='projects', content_rowid='rowid', tokenize='trigram case_sensitive 0'
+    );
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS projects_fts_ai AFTER INSERT ON projects BEGIN
+        INSERT INTO projects_fts(rowid, {cols}) VALUES (new.rowid, {new_cols});
+    END;
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS projects_fts_ad AFTER DELETE ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+    END;
+    """)
+    # chỉ các cột có index; update ngày S4 không đụng tới FTS
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS projects_fts_au AFTER UPDATE OF {cols} ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+        INSERT INTO projects_fts(rowid, {cols}) VALUES (new.rowid, {new_cols});
+    END;
+    """)
+    # data.db cũ (có projects trước khi có FTS) => backfill 1 lần
+    if not existed:
+        rebuild_fts(conn)
+
+def rebuild_fts(conn: Connection):
+    conn.execute("INSERT INTO projects_fts(projects_fts) VALUES('rebuild')")
+
+
+# cột ngày dd/mm/yyyy -> cột ISO tương ứng
+S4_DATE_COLUMNS = {
+    "s4_in_warehouse_date": "s4_in_warehouse_iso",
+    "s4_arrival_port_date": "s4_arrival_port_iso",
+    "s4_departure_date": "s4_departure_iso",
+}
+
+def dmy_to_iso_sql(col: str) -> str:
+    # "dd/mm/yyyy" -> "yyyy-mm-dd"; giá trị sai format => NULL
+    return (
+        f"CASE WHEN {col} GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]' "
+        f"THEN substr({col}, 7, 4) || '-' || substr({col}, 4, 2) || '-' || substr({col}, 1, 2) END"
+    )
+
+
+# ========= Rollup (tab Summary) =========
+# Tổng giữ sẵn, cập nhật theo delta bằng trigger => tab Summary đọc vài chục dòng, không groupby cả projects
+# - rollup_dims: (dim, key) -> số dòng, tổng qty, tổng qty × price_vnd; dim = si | eu | dgw_pic | asus_pic
+# - rollup_weekly: (event, tuần) -> như trên; event port | warehouse theo ngày S4 (cột ISO), tuần = ngày thứ Hai
+#   ngày đúng format nhưng không có thật (vd 45/13/2024) => date() NULL => không tính vào tuần nào
+# - trigger chỉ theo đúng cột liên quan: import logistics chỉ chạm rollup_weekly, và chỉ khi ngày S4 thực sự đổi
+# - key không còn dòng nào vẫn giữ (n_lines = 0); đọc thì lọc n_lines > 0
+# - rebuild_rollups / check_rollups: tính lại từ đầu (python db.py rebuild-rollups | check-rollups)
+ROLLUP_DIMS = ["si", "eu", "dgw_pic", "asus_pic"]
+ROLLUP_EVENTS = {
+    "port": "s4_arrival_port_date",
+    "warehouse": "s4_in_warehouse_date",
+}
+ROLLUP_UPSERT_SET = "n_lines = n_lines + excluded.n_lines, qty = qty + excluded.qty, value_vnd = value_vnd + excluded.value_vnd"
+
+def week_start_sql(iso_expr: str) -> str:
+    # yyyy-mm-dd -> thứ Hai cùng tuần ('weekday 0' = tới Chủ nhật, giữ nguyên nếu đã là Chủ nhật)
+    return f"date({iso_expr}, 'weekday 0', '-6 days')"
+
+def _rollup_dims_sql(row: str, sign: str) -> str:
+    # row: new | old; sign: "" (cộng) | "-" (trừ)
+    return "".join(f"""
+        INSERT INTO rollup_dims(dim, key, n_lines, qty, value_vnd)
+        VALUES ('{d}', {row}.{d}, {sign}1, {sign}{row}.qty, {sign}{row}.qty * {row}.price_vnd)
+        ON CONFLICT(dim, key) DO UPDATE SET {ROLLUP_UPSERT_SET};""" for d in ROLLUP_DIMS)
+
+def _rollup_week_sql(event: str, row: str, sign: str) -> str:
+    iso = f"{row}.{S4_DATE_COLUMNS[ROLLUP_EVENTS[event]]}"
+    return f"""
+        INSERT INTO rollup_weekly(event, week, n_lines, qty, value_vnd)
+        SELECT '{event}', {week_start_sql(iso)}, {sign}1, {sign}{row}.qty, {sign}{row}.qty * {row}.price_vnd
+        WHERE {week_start_sql(iso)} IS NOT NULL
+        ON CONFLICT(event, week) DO UPDATE SET {ROLLUP_UPSERT_SET};"""
+
+def init_rollups(conn: Connection):
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='rollup_dims'").fetchone()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_dims(
+        dim       TEXT NOT NULL,
+        key       TEXT NOT NULL,
+        n_lines   INTEGER NOT NULL,
+        qty       INTEGER NOT NULL,
+        value_vnd REAL NOT NULL,
+        PRIMARY KEY(dim, key)
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_weekly(
+        event     TEXT NOT NULL,      -- port | warehouse
+        week      TEXT NOT NULL,      -- yyyy-mm-dd (thứ Hai)
+        n_lines   INTEGER NOT NULL,
+        qty       INTEGER NOT NULL,
+        value_vnd REAL NOT NULL,
+        PRIMARY KEY(event, week)
+    );
+    """)
+    weeks_new = "".join(_rollup_week_sql(e, "new", "") for e in ROLLUP_EVENTS)
+    weeks_old = "".join(_rollup_week_sql(e, "old", "-") for e in ROLLUP_EVENTS)
+    triggers = {
+        "rollups_ai": f"AFTER INSERT ON projects BEGIN {_rollup_dims_sql('new', '')} {weeks_new} END",
+        "rollups_ad": f"AFTER DELETE ON projects BEGIN {_rollup_dims_sql('old', '-')} {weeks_old} END",
+        "rollups_dims_au": f"""AFTER UPDATE OF {', '.join(ROLLUP_DIMS)}, qty, price_vnd ON projects BEGIN
+            {_rollup_dims_sql('old', '-')} {_rollup_dims_sql('new', '')}
+        END""",
+    }
+    for event, col in ROLLUP_EVENTS.items():
+        iso = S4_DATE_COLUMNS[col]
+        triggers[f"rollups_{event}_au"] = f"""AFTER UPDATE OF {col}, qty, price_vnd ON projects
+        WHEN old.{iso} IS NOT new.{iso} OR old.qty IS NOT new.qty OR old.price_vnd IS NOT new.price_vnd
+        BEGIN {_rollup_week_sql(event, 'old', '-')} {_rollup_week_sql(event, 'new', '')} END"""
+    # thân trigger sinh từ code => tạo lại mỗi lần init, DB cũ cũng nhận bản mới
+    for name, body in triggers.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} {body}")
+    # data.db cũ (có projects trước khi có rollup) => backfill 1 lần
+    if not existed:
+        rebuild_rollups(conn)
+
+def _rollup_full_sql() -> tuple[str, str]:
+    # (SELECT rollup_dims, SELECT rollup_weekly) tính từ đầu trên projects
+    dims = " UNION ALL ".join(
+        f"SELECT '{d}', {d}, COUNT(*), SUM(qty), SUM(qty * price_vnd) FROM projects GROUP BY {d}" for d in ROLLUP_DIMS
+    )
+    weeks = " UNION ALL ".join(
+        f"SELECT '{e}', {week_start_sql(S4_DATE_COLUMNS[c])} AS week, COUNT(*), SUM(qty), SUM(qty * price_vnd) "
+        f"FROM projects WHERE week IS NOT NULL GROUP BY week"
+        for e, c in ROLLUP_EVENTS.items()
+    )
+    return dims, weeks
+
+def rebuild_rollups(conn: Connection):
+    dims, weeks = _rollup_full_sql()
+    conn.execute("DELETE FROM rollup_dims")
+    conn.execute(f"INSERT INTO rollup_dims(dim, key, n_lines, qty, value_vnd) {dims}")
+    conn.execute("DELETE FROM rollup_weekly")
+    conn.execute(f"INSERT INTO rollup_weekly(event, week, n_lines, qty, value_vnd) {weeks}")
+
+def check_rollups(conn: Connection) -> list[tuple]:
+    # so rollup đang giữ với tính lại từ đầu; trả các (bảng, key, giữ sẵn, tính lại) lệch nhau
+    # value_vnd là REAL cộng dồn => so theo sai số tương đối
+    def close(a, b):
+        return a[:2] == b[:2] and abs(a[2] - b[2]) <= 1e-9 * max(1.0, abs(a[2]), abs(b[2]))
+
+    diffs = []
+    dims, weeks = _rollup_full_sql()
+    for table, full in (("rollup_dims", dims), ("rollup_weekly", weeks)):
+        kept = {tuple(r[:2]): tuple(r[2:]) for r in conn.execute(f"SELECT * FROM {table} WHERE n_lines != 0")}
+        fresh = {tuple(r[:2]): tuple(r[2:]) for r in conn.execute(full)}
+        for key in kept.keys() | fresh.keys():
+            a, b = kept.get(key), fresh.get(key)
+            if a is None or b is None or not close(a, b):
+                diffs.append((table, key, a, b))
+    return diffs
+
+def add_column_if_missing(conn: Connection, table: str, column: str, decl: str):
+    # migration nhẹ cho data.db cũ (table_xinfo: thấy cả cột generated)
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_xinfo({table})")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+class _WriteOp:
+    __slots__ = ("fn", "args", "kwargs", "future", "exclusive", "ctx")
+
+    def __init__(self, fn, args, kwargs, exclusive: bool):
+        self.fn, self.args, self.kwargs, self.exclusive = fn, args, kwargs, exclusive
+        self.future = Future()
+        # chạy trong context của người gọi => perf (ContextVar) tính SQL vào đúng lần rerun / job
+        self.ctx = contextvars.copy_context()
+
+
+class ConnectionPool:
+    def __init__(self, path: str = DB_PATH, read_size: int = READ_POOL_SIZE):
+        self.path = path
+        self._write_lock = threading.RLock()
+        self._writer = _connect(path, readonly=False)
+        # WAL lưu vĩnh viễn trong file DB; chỉ cần set 1 lần từ connection ghi
+        self._writer.execute("PRAGMA journal_mode = WAL;")
+        # version nội bộ (tăng khi write() commit) + PRAGMA data_version (ghi từ connection/process khác)
+        self._version = 0
+        self._version_lock = threading.Lock()
+        with self.write() as conn:
+            init_db(conn)
+        self._version_conn = _connect(path, readonly=True)
+        self._readers: Queue[Connection] = Queue()
+        for _ in range(max(1, read_size)):
+            self._readers.put(_connect(path, readonly=True))
+        # writer thread khởi động ở lần submit() đầu tiên
+        self._ops: Queue[_WriteOp | None] = Queue()
+        self._writer_thread: threading.Thread | None = None
+        self._writer_start_lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def read(self) -> Iterator[Connection]:
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def write(self) -> Iterator[Connection]:
+        # 1 writer / process; lồng write() trong cùng thread => dùng chung transaction ngoài
+        with self._write_lock:
+            conn = self._writer
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            if conn.in_transaction:
+                conn.commit()
+            self.bump_version()
+
+    # ---------- writer thread (group commit) ----------
+    def submit(self, fn, *args, **kwargs) -> Future:
+        # fn(conn, *args, **kwargs) chạy trên writer thread; KHÔNG tự BEGIN/COMMIT trong fn
+        return self._enqueue(_WriteOp(fn, args, kwargs, exclusive=False))
+
+    def submit_exclusive(self, fn, *args, **kwargs) -> Future:
+        # như submit nhưng chạy 1 mình trong 1 transaction (chunk import lớn: không giữ các thao tác nhỏ chờ lâu)
+        return self._enqueue(_WriteOp(fn, args, kwargs, exclusive=True))
+
+    def run_write(self, fn, *args, **kwargs):
+        # submit + chờ kết quả (lỗi trong fn => raise lại ở đây)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _enqueue(self, op: _WriteOp) -> Future:
+        if self._closed:
+            raise RuntimeError("ConnectionPool đã đóng")
+        if self._writer_thread is None:
+            with self._writer_start_lock:
+                if self._writer_thread is None:
+                    self._writer_thread = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+                    self._writer_thread.start()
+        self._ops.put(op)
+        return op.future
+
+    def _writer_loop(self):
+        # None trong hàng đợi = dừng (close())
+        carry = []    # thao tác đã lấy ra nhưng thuộc nhóm sau (exclusive / None)
+        while True:
+            op = carry.pop() if carry else self._ops.get()
+            if op is None:
+                return
+            batch = [op]
+            # gộp các thao tác nhỏ ĐANG chờ sẵn (không chờ thêm => không tăng độ trễ khi chỉ có 1 người ghi)
+            while not op.exclusive and len(batch) < GROUP_COMMIT_MAX_OPS:
+                try:
+                    nxt = self._ops.get_nowait()
+                except Empty:
+                    break
+                if nxt is None or nxt.exclusive:
+                    carry.append(nxt)
+                    break
+                batch.append(nxt)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: list):
+        ops = [op for op in batch if op.future.set_running_or_notify_cancel()]
+        if not ops:
+            return
+        outcomes = []
+        try:
+            with self.write() as conn:
+                for op in ops:
+                    conn.execute("SAVEPOINT write_op")
+                    try:
+                        value = op.ctx.run(op.fn, conn, *op.args, **op.kwargs)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_op")
+                        conn.execute("RELEASE write_op")
+                        outcomes.append((False, e))
+                    else:
+                        conn.execute("RELEASE write_op")
+                        outcomes.append((True, value))
+        except Exception as e:
+            # BEGIN / COMMIT lỗi => không thao tác nào được ghi
+            for op in ops:
+                op.future.set_exception(e)
+            return
+        for op, (ok, value) in zip(ops, outcomes):
+            if ok:
+                op.future.set_result(value)
+            else:
+                op.future.set_exception(value)
+
+    def bump_version(self):
+        with self._version_lock:
+            self._version += 1
+
+    def data_version(self) -> tuple[int, int]:
+        # PRAGMA data_version chỉ đọc WAL index (shared memory), không đọc page dữ liệu
+        with self._version_lock:
+            external = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+            return self._version, external
+
+    def close(self):
+        # thao tác đã submit chạy xong rồi mới đóng connection
+        self._closed = True
+        if self._writer_thread is not None:
+            self._ops.put(None)
+            self._writer_thread.join()
+        with self._write_lock:
+            self._writer.close()
+        with self._version_lock:
+            self._version_conn.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+
+# ========= Settings / ID =========
+LATEST_UPDATE_S4_FORMAT = "%d-%m-%Y %H:%M"
+
+def get_latest_update_s4(conn: Connection) -> str | None:
+    cur = conn.execute("SELECT value FROM settings WHERE key='latest_update_s4'")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def set_latest_update_s4(conn: Connection, ts_str: str):
+    conn.execute("INSERT INTO settings(key,value) VALUES('latest_update_s4', ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (ts_str,))
+
+# Sequence: cấp ID O(1), không đụng hàng khi nhiều session/process insert cùng lúc
+# - reserve_ids() phải chạy trong pool.write() (BEGIN IMMEDIATE => khoá ghi toàn DB)
+# - xoá dự án không làm trùng ID (không dựa vào COUNT(*))
+def init_sequences(conn: Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS id_sequences(
+        name       TEXT PRIMARY KEY,
+        next_value INTEGER NOT NULL
+    );
+    """)
+    # data.db cũ: bắt đầu sau số PJT-xxxxx lớn nhất đang có
+    conn.execute("""
+    INSERT OR IGNORE INTO id_sequences(name, next_value)
+    SELECT 'project', COALESCE(MAX(CAST(substr(project_id, 5) AS INTEGER)), 0) + 1
+    FROM projects WHERE project_id LIKE 'PJT-%'
+    """)
+
+def reserve_ids(conn: Connection, count: int, name: str = "project") -> range:
+    # giữ chỗ 1 block [start, start+count) trong 1 câu UPDATE ... RETURNING
+    if count <= 0:
+        return range(0)
+    row = conn.execute(
+        "UPDATE id_sequences SET next_value = next_value + ? WHERE name=? RETURNING next_value",
+        (count, name),
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"Sequence không tồn tại: {name}")
+    return range(row[0] - count, row[0])
+
+def gen_project_ids(conn: Connection, count: int) -> list[str]:
+    # cấp 1 block ID liên tục cho cả batch
+    return [f"PJT-{n:05d}" for n in reserve_ids(conn, count)]
+
+def gen_project_id(conn: Connection) -> str:
+    return gen_project_ids(conn, 1)[0]
+
+
+# ========= CLI bảo trì =========
+# python db.py rebuild-fts|rebuild-status|rebuild-rollups|check-rollups [--db data.db]
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Bảo trì data.db")
+    ap.add_argument("command", choices=["rebuild-fts", "rebuild-status", "rebuild-rollups", "check-rollups"])
+    ap.add_argument("--db", default=DB_PATH)
+    args = ap.parse_args()
+
+    pool = ConnectionPool(args.db, read_size=1)
+    try:
+        if args.command == "rebuild-fts":
+            with pool.write() as conn:
+                rebuild_fts(conn)
+                n = conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+            print(f"Rebuilt projects_fts ({n} rows)")
+        elif args.command == "rebuild-status":
+            with pool.write() as conn:
+                rebuild_current_status(conn)
+                n = conn.execute("SELECT COUNT(*) FROM project_current_status").fetchone()[0]
+            print(f"Rebuilt project_current_status ({n} projects)")
+        elif args.command == "check-rollups":
+            with pool.read() as conn:
+                diffs = check_rollups(conn)
+            for table, key, kept, fresh in diffs[:50]:
+                print(f"{table} {key}: kept={kept} fresh={fresh}")
+            print(f"{len(diffs)} rollup rows differ" if diffs else "Rollups OK")
+        elif args.command == "rebuild-rollups":
+            with pool.write() as conn:
+                n_diff = len(check_rollups(conn))
+                rebuild_rollups(conn)
+            print(f"Rebuilt rollup_dims + rollup_weekly ({n_diff} rows differed before rebuild)")
+    finally:
+        pool.close()
@@ -0,0 +1,130 @@
+# export.py
+# Xuất bảng Projects (Tab 1, đúng filter đang xem) ra CSV / XLSX — stream từ cursor SQLite, RAM không đổi theo số dòng
+#
+# Lưu ý:
+# - Cùng câu query với Tab 1 (queries.project_view_sql): cùng filter, cùng sort, đúng thứ tự cột đã lock + header tiếng Việt
+# - Đọc bằng fetchmany(EXPORT_CHUNK_ROWS), ghi từng chunk ra file => không dựng DataFrame cả bảng
+# - CSV: utf-8-sig (Excel mở đúng tiếng Việt); XLSX: openpyxl write_only (ghi tuần tự, không giữ cả sheet)
+# - Chạy trên 1 connection đọc trong 1 transaction đọc => snapshot nhất quán kể cả khi đang có import
+# - File xuất nằm ở EXPORT_DIR; file cũ hơn EXPORT_KEEP_S bị xoá ở lần xuất sau
+#
+# python export.py csv|xlsx OUT [--db data.db] [--search X] [--si X] [--pi_no X] ...
+
+import csv
+import os
+import tempfile
+import time
+
+import openpyxl
+
+import perf
+from queries import PROJECT_DISPLAY_COLUMNS, PROJECT_FILTER_COLUMNS, project_view_sql
+
+EXPORT_DIR = "exports"
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_KEEP_S = 24 * 3600
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_SHEET = "Projects"
+
+
+def export_header() -> list[str]:
+    # Project ID (index của bảng Tab 1) + các cột theo thứ tự lock
+    return ["Project ID", *PROJECT_DISPLAY_COLUMNS.values()]
+
+def iter_project_rows(conn, filters: dict, search: str | None = None, dates: dict | None = None,
+                      chunk_rows: int = EXPORT_CHUNK_ROWS):
+    # từng list tuple (tối đa chunk_rows dòng), đúng thứ tự export_header()
+    sql, params = project_view_sql(filters, search, dates)
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cur.close()
+
+def write_projects_csv(conn, path: str, filters: dict, search: str | None = None,
+                       dates: dict | None = None) -> int:
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(export_header())
+        for rows in iter_project_rows(conn, filters, search, dates):
+            w.writerows(rows)
+            n += len(rows)
+    return n
+
+def write_projects_xlsx(conn, path: str, filters: dict, search: str | None = None,
+                        dates: dict | None = None) -> int:
+    n = 0
+    wb = openpyxl.Workbook(write_only=True)
+    try:
+        ws = wb.create_sheet(EXPORT_SHEET)
+        ws.freeze_panes = "A2"
+        ws.append(export_header())
+        for rows in iter_project_rows(conn, filters, search, dates):
+            for r in rows:
+                ws.append(r)
+            n += len(rows)
+        wb.save(path)
+    finally:
+        wb.close()
+    return n
+
+def export_projects(conn, fmt: str, path: str, filters: dict, search: str | None = None,
+                    dates: dict | None = None) -> int:
+    # trả số dòng đã xuất (không tính header)
+    writer = {"csv": write_projects_csv, "xlsx": write_projects_xlsx}[fmt]
+    with perf.stage("export", fmt) as s:
+        n = writer(conn, path, filters, search, dates)
+        s.rows = n
+    return n
+
+def export_path(fmt: str, export_dir: str = EXPORT_DIR) -> str:
+    # file mới (tên không trùng giữa các session) trong export_dir; dọn file cũ
+    os.makedirs(export_dir, exist_ok=True)
+    cleanup_exports(export_dir)
+    fd, path = tempfile.mkstemp(prefix=time.strftime("projects_%Y%m%d_%H%M%S_"), suffix=f".{fmt}", dir=export_dir)
+    os.close(fd)
+    return path
+
+def cleanup_exports(export_dir: str = EXPORT_DIR, keep_s: float = EXPORT_KEEP_S):
+    now = time.time()
+    for name in os.listdir(export_dir):
+        p = os.path.join(export_dir, name)
+        try:
+            if os.path.isfile(p) and now - os.path.getmtime(p) > keep_s:
+                os.remove(p)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import DB_PATH, ConnectionPool
+
+    ap = argparse.ArgumentParser(description="Xuất bảng Projects (có filter) ra CSV / XLSX")
+    ap.add_argument("format", choices=list(EXPORT_FORMATS))
+    ap.add_argument("out")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--search", default=None, help="tìm tất cả (như ô tìm kiếm Tab 1)")
+    for col in [*PROJECT_FILTER_COLUMNS, "current_status"]:
+        ap.add_argument(f"--{col}", default=None)
+    args = ap.parse_args()
+
+    pool = ConnectionPool(args.db, read_size=1)
+    try:
+        t0 = time.perf_counter()
+        with pool.read() as conn:
+            n = export_projects(conn, args.format, args.out,
+                                {c: getattr(args, c) for c in [*PROJECT_FILTER_COLUMNS, "current_status"]},
+                                args.search)
+        print(f"Exported {n} rows -> {args.out} ({time.perf_counter() - t0:.1f}s)")
+    finally:
+        pool.close()
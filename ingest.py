@@ -0,0 +1,640 @@
+# ingest.py
+# Pipeline nhập dữ liệu (Add Project: Paste + Import CSV/XLSX)
+#
+# Lưu ý:
+# - Validate/chuẩn hoá theo CỘT bằng pandas (không iterrows)
+# - Cấp 1 block project_id liên tục cho cả batch, ghi bằng executemany trong 1 transaction
+# - Dòng bị loại trả về kèm lý do (cột "Dòng" + "Lý do")
+# - Các bước chính gắn perf.timed (đo khi bật perf, tắt => gọi thẳng hàm)
+# - File CSV: tự đoán encoding (UTF-8 / Windows-1258...) + dấu phân cách; chỉ đọc các cột đã map, kiểu str
+# - Nhiều file / mọi sheet của workbook: read_mapped_many (parse song song nhiều process, ghép theo thứ tự)
+
+import codecs
+import io
+import multiprocessing
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import repeat
+from sqlite3 import Connection
+
+import chardet
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import perf
+from db import gen_project_ids
+
+REQUIRED_ADD_FIELDS = ["dgw_pic","asus_pic","sku_code","qty","price_vnd","si","eu"]  # bắt buộc
+OPTIONAL_ADD_FIELDS = ["partnumber","asus_order_email"]
+
+# Thứ tự đã lock cho Paste: DGW PIC / ASUS PIC / Part number / Mã hàng / Số lượng / Đơn giá FV / Mail / SI / EU
+PASTE_COLUMNS = ["dgw_pic","asus_pic","partnumber","sku_code","qty","price_vnd","asus_order_email","si","eu"]
+
+PROJECT_INSERT_COLUMNS = [
+    "project_id","dgw_pic","asus_pic","partnumber","sku_code","qty","price_vnd","asus_order_email","si","eu",
+    "pi_no","bill_no","lot_no","declaration_no",
+    "s4_in_warehouse_date","s4_arrival_port_date","s4_departure_date","row_created_at",
+]
+
+# tăng khi đổi bảng map header / cách chuẩn hoá => cache upload cũ tự hết hiệu lực
+MAPPING_VERSION = 1
+
+# header file import (strip + lower) -> cột chuẩn
+ADD_PROJECT_HEADERS = {
+    "dgw_pic": ("dgw pic","dgw_pic"),
+    "asus_pic": ("asus pic","asus_pic"),
+    "partnumber": ("part number","partnumber"),
+    "sku_code": ("mã hàng","ma hang","sku_code","sku"),
+    "qty": ("số lượng","so luong","qty","quantity"),
+    "price_vnd": ("đơn giá fv","don gia fv","price_vnd","price","unit price","gia"),
+    "asus_order_email": ("mail nhận đơn hàng từ asus","mail nhan don hang tu asus","asus_order_email","order email"),
+    "si": ("si",),
+    "eu": ("eu",),
+}
+
+LOGISTICS_FIELDS = {
+    # cột map chuẩn -> cột projects
+    "Bill": "bill_no",
+    "Lot_No": "lot_no",
+    "Declaration_No": "declaration_no",
+    "S4_In_Warehouse_Date": "s4_in_warehouse_date",
+    "S4_Arrival_Port_Date": "s4_arrival_port_date",
+    "S4_Departure_Date": "s4_departure_date",
+}
+LOGISTICS_DATE_FIELDS = ["S4_In_Warehouse_Date", "S4_Arrival_Port_Date", "S4_Departure_Date"]
+
+# Excel serial date: ngày 0 = 30/12/1899
+EXCEL_EPOCH = "1899-12-30"
+
+REJECT_COLUMNS = ["Dòng", "Lý do"]
+SOURCE_COLUMN = "Nguồn"    # file / sheet nguồn khi đọc nhiều phần (xem read_mapped_many)
+FIELD_LABELS = {
+    "dgw_pic": "DGW PIC", "asus_pic": "ASUS PIC", "sku_code": "Mã hàng", "si": "SI", "eu": "EU",
+}
+
+
+# chuẩn hóa ngày: input có thể dd/mm/yyyy hoặc yyyy-mm-dd -> output dd/mm/yyyy
+def normalize_date_cell(val) -> str | None:
+    if val is None: return None
+    if isinstance(val, float) and pd.isna(val): return None
+    s = str(val).strip()
+    if s == "" or s.lower() in {"nan","nat","none"}:
+        return None
+    # cố parse
+    try:
+        if "-" in s:
+            # yyyy-mm-dd (hoặc ISO)
+            dt = pd.to_datetime(s, errors="coerce")
+            if pd.isna(dt): return None
+            return dt.strftime("%d/%m/%Y")
+        elif "/" in s:
+            # dd/mm/yyyy có thể
+            # pandas thông minh đủ, chúng ta ép dayfirst
+            dt = pd.to_datetime(s, dayfirst=True, errors="coerce")
+            if pd.isna(dt): return None
+            return dt.strftime("%d/%m/%Y")
+        else:
+            # Excel serial? (unit="D" không nhận chuỗi => float trước)
+            dt = pd.to_datetime(float(s), errors="coerce", unit="D", origin=EXCEL_EPOCH)
+            if pd.isna(dt):
+                return None
+            return dt.strftime("%d/%m/%Y")
+    except Exception:
+        return None
+
+# bản vector của normalize_date_cell (cùng output dd/mm/yyyy | None) cho cả cột
+# - factorize => chỉ xử lý giá trị DISTINCT (file logistics lặp lại vài trăm ngày cho hàng nghìn dòng)
+# - chia nhóm như bản scalar: datetime thật (openpyxl) / có "-" (ISO) / có "/" (dd/mm/yyyy) / Excel serial
+# - mỗi nhóm parse 1 lần: thử format nhanh, phần còn lại format="mixed" (= parse từng giá trị như scalar)
+# - lỗi bất thường trong 1 nhóm => fallback normalize_date_cell cho nhóm đó
+@perf.timed("pandas", rows_arg=0)
+def normalize_date_series(values: pd.Series) -> pd.Series:
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    out_u = np.full(len(uniques), None, dtype=object)
+    if len(uniques):
+        u = pd.Series(np.asarray(uniques, dtype=object))
+        is_dt = u.map(lambda v: isinstance(v, (date, pd.Timestamp)))
+        s = u.map(lambda v: str(v).strip())
+        valid = ~is_dt & (s != "") & ~s.str.lower().isin(["nan", "nat", "none"])
+        dash = valid & s.str.contains("-", regex=False)
+        slash = valid & ~dash & s.str.contains("/", regex=False)
+        serial = valid & ~dash & ~slash
+        for mask, parse in (
+            (is_dt, lambda x: pd.to_datetime(u[x.index], errors="coerce")),
+            (dash, lambda x: _parse_date_strings(x, "ISO8601", dayfirst=False)),
+            (slash, lambda x: _parse_date_strings(x, "%d/%m/%Y", dayfirst=True)),
+            (serial, lambda x: pd.to_datetime(pd.to_numeric(x, errors="coerce"), errors="coerce", unit="D", origin=EXCEL_EPOCH)),
+        ):
+            if not mask.any():
+                continue
+            group = s[mask]
+            try:
+                dt = parse(group)
+                txt = dt.dt.strftime("%d/%m/%Y")
+                out_u[group.index] = np.where(dt.notna().to_numpy(), txt.to_numpy(dtype=object), None)
+            except Exception:
+                out_u[group.index] = [normalize_date_cell(v) for v in u[mask]]
+    res = np.full(len(codes), None, dtype=object)
+    hit = codes >= 0
+    res[hit] = out_u[codes[hit]]
+    return pd.Series(res, index=values.index, dtype=object)
+
+def _parse_date_strings(strs: pd.Series, fast_format: str, dayfirst: bool) -> pd.Series:
+    dt = pd.to_datetime(strs, format=fast_format, errors="coerce")
+    rest = dt.isna()
+    if rest.any():
+        dt[rest] = pd.to_datetime(strs[rest], format="mixed", dayfirst=dayfirst, errors="coerce")
+    return dt
+
+def find_header(columns, *cands):
+    # trả về tên cột gốc nếu trùng một trong các ứng viên (NFC + strip + lower)
+    cands_l = [c.lower() for c in cands]
+    for orig in columns:
+        if unicodedata.normalize("NFC", str(orig)).strip().lower() in cands_l:
+            return orig
+    return None
+
+def add_project_column_map(columns) -> dict:
+    # header VN/EN, thứ tự/hoa thường không bắt buộc; thiếu cột bắt buộc => ValueError
+    cols = {key: find_header(columns, *cands) for key, cands in ADD_PROJECT_HEADERS.items()}
+    missing = [k for k in REQUIRED_ADD_FIELDS if cols[k] is None]
+    if missing:
+        raise ValueError(f"Thiếu cột bắt buộc trong file import: {', '.join(missing)}")
+    return cols
+
+@perf.timed("pandas", rows_arg=0)
+def map_add_project_columns(df: pd.DataFrame, cols: dict | None = None) -> pd.DataFrame:
+    cols = cols or add_project_column_map(df.columns)
+    return pd.DataFrame({key: (df[col] if col is not None else None) for key, col in cols.items()},
+                        index=df.index)
+
+@perf.timed("parse")
+def parse_paste_text(txt: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # mỗi dòng 1 dự án, TSV hoặc CSV; dòng đầu là header nếu cột Số lượng không phải số
+    lines = [ln for ln in txt.strip().splitlines() if ln.strip() != ""]
+    if not lines:
+        return pd.DataFrame(columns=PASTE_COLUMNS), pd.DataFrame(columns=REJECT_COLUMNS)
+    s = pd.Series(lines, index=pd.RangeIndex(1, len(lines) + 1)).str.replace("\t", ",", regex=False)
+    parts = s.str.split(",", expand=True).reindex(columns=range(len(PASTE_COLUMNS)))
+    parts.columns = PASTE_COLUMNS
+    parts = parts.astype("string").apply(lambda c: c.str.strip())
+    n_parts = s.str.count(",") + 1
+    # bỏ dòng header
+    if n_parts[1] >= len(PASTE_COLUMNS) and pd.isna(pd.to_numeric(parts.at[1, "qty"], errors="coerce")):
+        parts = parts.drop(index=1)
+        n_parts = n_parts.drop(index=1)
+    short = n_parts < len(PASTE_COLUMNS)
+    rejected = pd.DataFrame({"Dòng": n_parts.index[short], "Lý do": f"Thiếu cột (cần {len(PASTE_COLUMNS)} cột)"})
+    return parts[~short], rejected
+
+def _clean_str(s: pd.Series) -> pd.Series:
+    # strip; rỗng / NaN => NA
+    s = s.astype("string").str.strip()
+    return s.mask(s == "")
+
+@perf.timed("pandas", rows_arg=0)
+def prepare_projects(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # df: các cột PASTE_COLUMNS (đã map); index = số dòng nguồn (dùng cho báo lỗi)
+    out = pd.DataFrame(index=df.index)
+    for col in REQUIRED_ADD_FIELDS + OPTIONAL_ADD_FIELDS:
+        if col in ("qty", "price_vnd"):
+            continue
+        out[col] = _clean_str(df[col]) if col in df else pd.Series(pd.NA, index=df.index, dtype="string")
+    out["sku_code"] = out["sku_code"].str.upper()
+    qty = np.trunc(pd.to_numeric(df["qty"], errors="coerce"))
+    price = pd.to_numeric(df["price_vnd"], errors="coerce")
+    out["qty"] = qty.astype("Int64")
+    out["price_vnd"] = price.astype("Float64")
+
+    reasons = pd.Series("", index=df.index)
+    missing = out[[c for c in REQUIRED_ADD_FIELDS if c not in ("qty", "price_vnd")]].isna()
+    for col in missing.columns:
+        reasons = reasons.mask(missing[col], reasons + f"Thiếu {FIELD_LABELS[col]}; ")
+    reasons = reasons.mask(qty.isna() | (qty <= 0), reasons + "Số lượng không hợp lệ; ")
+    reasons = reasons.mask(price.isna() | (price < 0), reasons + "Đơn giá không hợp lệ; ")
+
+    bad = reasons != ""
+    if SOURCE_COLUMN in df:
+        # nhiều file / sheet: số dòng chỉ có nghĩa trong từng file => ghi kèm nguồn
+        reasons = reasons.mask(bad, "[" + df[SOURCE_COLUMN].astype(str) + "] " + reasons)
+    rejected = pd.DataFrame({"Dòng": df.index[bad], "Lý do": reasons[bad].str.rstrip("; ").to_numpy()})
+    return out[~bad], rejected
+
+@perf.timed("import", rows_arg=1)
+def insert_projects(conn: Connection, df: pd.DataFrame, now: str | None = None) -> list[str]:
+    # df: output hợp lệ của prepare_projects; gọi bên trong pool.write()
+    if len(df) == 0:
+        return []
+    now = now or datetime.now().strftime("%Y-%m-%d %H:%M")
+    ids = gen_project_ids(conn, len(df))
+    data = {c: [None] * len(df) for c in PROJECT_INSERT_COLUMNS}
+    data["project_id"] = ids
+    data["row_created_at"] = [now] * len(df)
+    for col in REQUIRED_ADD_FIELDS + OPTIONAL_ADD_FIELDS:
+        data[col] = df[col].astype(object).where(df[col].notna(), None).tolist()
+    rows = zip(*(data[c] for c in PROJECT_INSERT_COLUMNS))
+    conn.executemany(
+        f"INSERT INTO projects({','.join(PROJECT_INSERT_COLUMNS)}) VALUES ({','.join('?' * len(PROJECT_INSERT_COLUMNS))})",
+        rows,
+    )
+    return ids
+
+def import_projects(conn: Connection, df: pd.DataFrame) -> tuple[list[str], pd.DataFrame]:
+    # validate + insert cả batch; trả (project_id đã tạo, dòng bị loại kèm lý do)
+    valid, rejected = prepare_projects(df)
+    return insert_projects(conn, valid), rejected
+
+
+# === Mapping Import Logistics (LOCKED) ===
+# PI: Hợp đồng/ Số PO NK
+# Bill: Bill of lading
+# S4_Arrival_Port_Date: Ngày đến cảng
+# S4_In_Warehouse_Date: Ngày đến kho
+# S4_Departure_Date: Ngày khởi hành
+# Declaration_No: Số tờ khai
+# Lot_No: Số lô
+
+LOGISTICS_HEADERS = {
+    "PI": ("hợp đồng/ số po nk","hop dong/ so po nk","hop dong / so po nk","so po nk","pi","số pi","pi no"),
+    "Bill": ("bill of lading","bill","vận đơn"),
+    "S4_Arrival_Port_Date": ("ngày đến cảng","ngay den cang","s4_arrival_port_date"),
+    "S4_In_Warehouse_Date": ("ngày đến kho","ngay den kho","s4_in_warehouse_date"),
+    "S4_Departure_Date": ("ngày khởi hành","ngay khoi hanh","s4_departure_date"),
+    "Declaration_No": ("số tờ khai","so to khai","declaration_no"),
+    "Lot_No": ("số lô","so lo","lot_no"),
+}
+
+def logistics_column_map(columns) -> dict:
+    # cột chuẩn -> tên cột gốc trong file (None nếu không có); chạy 1 lần theo header
+    return {key: find_header(columns, *cands) for key, cands in LOGISTICS_HEADERS.items()}
+
+@perf.timed("pandas", rows_arg=0)
+def map_import_logistics_columns(df: pd.DataFrame, colmap: dict | None = None) -> pd.DataFrame:
+    # tạo df chuẩn với các cột chính (có thể None)
+    colmap = colmap or logistics_column_map(df.columns)
+    return pd.DataFrame({key: (df[col] if col is not None else None) for key, col in colmap.items()},
+                        index=df.index)
+
+@perf.timed("pandas", rows_arg=0)
+def prepare_logistics(df_map: pd.DataFrame) -> pd.DataFrame:
+    # index = PI chuẩn hoá (strip + upper); cột = cột projects; ô trống => NA
+    # duplicate PI trong file: last-write-wins theo từng ô (groupby.last bỏ qua NA => ô trống không ghi đè)
+    out = pd.DataFrame({"pi_key": _clean_str(df_map["PI"]).str.upper()}, index=df_map.index)
+    for src, col in LOGISTICS_FIELDS.items():
+        if src in LOGISTICS_DATE_FIELDS:
+            out[col] = normalize_date_series(df_map[src])
+        else:
+            out[col] = _clean_str(df_map[src])
+    out = out[out["pi_key"].notna()]    # không có PI -> bỏ qua (theo spec match theo PI)
+    return out.groupby("pi_key", sort=False).last()
+
+@perf.timed("import", rows_arg=1)
+def merge_logistics(conn: Connection, staged: pd.DataFrame) -> tuple[set, int]:
+    # merge set-based: staging (TEMP) -> 1 câu UPDATE ... FROM theo projects.pi_key (có index)
+    # COALESCE: ô trống không ghi đè; chỉ đụng dòng thực sự đổi giá trị
+    # trả (các PI có project khớp, số dòng projects được update)
+    cols = list(LOGISTICS_FIELDS.values())
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS logistics_staging(pi_key TEXT PRIMARY KEY, {', '.join(c + ' TEXT' for c in cols)})")
+    conn.execute("DELETE FROM logistics_staging")
+    rows = staged.astype(object).where(staged.notna(), None).itertuples(name=None)
+    conn.executemany(f"INSERT INTO logistics_staging(pi_key, {', '.join(cols)}) VALUES ({', '.join('?' * (len(cols) + 1))})", rows)
+    # có thống kê thì planner mới chạy staging ở vòng ngoài + lookup idx_projects_pi_key
+    conn.execute("ANALYZE temp.logistics_staging")
+    matched = {r[0] for r in conn.execute(
+        "SELECT s.pi_key FROM logistics_staging s WHERE EXISTS (SELECT 1 FROM projects p WHERE p.pi_key = s.pi_key)"
+    )}
+    sets = ", ".join(f"{c} = COALESCE(s.{c}, projects.{c})" for c in cols)
+    changed = " OR ".join(f"(s.{c} IS NOT NULL AND s.{c} IS NOT projects.{c})" for c in cols)
+    cur = conn.execute(f"UPDATE projects SET {sets} FROM logistics_staging s WHERE projects.pi_key = s.pi_key AND ({changed})")
+    updated = cur.rowcount
+    conn.execute("DELETE FROM logistics_staging")
+    return matched, updated
+
+def apply_logistics(conn: Connection, df_map: pd.DataFrame) -> dict:
+    # gọi bên trong pool.write(); trả {"matched", "unmatched", "updated"} (matched/unmatched = số PI trong file)
+    staged = prepare_logistics(df_map)
+    matched, updated = merge_logistics(conn, staged)
+    return {"matched": len(matched), "unmatched": len(staged) - len(matched), "updated": updated}
+
+
+# ========= Đọc file (streaming) =========
+# - CSV: encoding + dấu phân cách đoán từ SNIFF_BYTES đầu file (xem sniff_csv); read_csv(chunksize)
+# - XLSX: openpyxl read_only, duyệt từng dòng; sheet=None => sheet đầu (giống pd.read_excel mặc định)
+# - mọi chunk có index = vị trí dòng dữ liệu (0-based, liên tục qua các chunk)
+# - đọc dtype=str: mỗi chunk tự đoán kiểu sẽ không nhất quán (PI "00123" vs 123) + không tốn công suy kiểu;
+#   các pipeline tự chuẩn hoá số/ngày
+# - usecols (tên cột): chỉ đọc các cột đã map => cột thừa của file (export forwarder rất rộng) không bị parse
+CHUNK_ROWS = 20_000
+PREVIEW_ROWS = 20
+SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = ",;\t|"
+# file CSV tiếng Việt lưu từ Excel/Windows cũ; chardet đoán kém với mẫu ngắn (hay ra Big5...) => mặc định
+LEGACY_ENCODING = "cp1258"
+SNIFF_ENCODINGS = {"ascii", "utf-8", "cp1258", "cp1252", "iso8859-1"}   # kết quả chardet được tin
+
+def _source_name(source) -> str:
+    # file upload của Streamlit (có .name) hoặc đường dẫn file (CLI batch)
+    return str(getattr(source, "name", source)).lower()
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+def _head_bytes(source, n: int = SNIFF_BYTES) -> bytes:
+    _rewind(source)
+    if hasattr(source, "read"):
+        head = source.read(n)
+        source.seek(0)
+        return head
+    with open(source, "rb") as f:
+        return f.read(n)
+
+def sniff_csv(sample: bytes) -> tuple[str, str]:
+    # (encoding, dấu phân cách) từ vài KB đầu file
+    if sample.startswith(codecs.BOM_UTF8):
+        enc = "utf-8-sig"
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        enc = "utf-16"
+    else:
+        # bỏ dòng dở cuối mẫu (ký tự UTF-8 nhiều byte có thể bị cắt đôi)
+        cut = sample[:sample.rfind(b"\n") + 1] or sample
+        try:
+            cut.decode("utf-8")
+            enc = "utf-8"
+        except UnicodeDecodeError:
+            guess = chardet.detect(cut)["encoding"]
+            try:
+                enc = codecs.lookup(guess).name if guess else LEGACY_ENCODING
+            except LookupError:
+                enc = LEGACY_ENCODING
+            if enc not in SNIFF_ENCODINGS:
+                enc = LEGACY_ENCODING
+    header = sample.decode(enc, errors="replace").lstrip("\ufeff").partition("\n")[0]
+    sep = max(CSV_DELIMITERS, key=header.count)
+    return enc, sep if header.count(sep) else ","
+
+def _nfc(s: str) -> str:
+    # cp1258 giải mã ra chữ + dấu thanh rời (tổ hợp) => gộp lại cho khớp header / tìm kiếm
+    return unicodedata.normalize("NFC", s)
+
+def _csv_options(source) -> dict:
+    enc, sep = sniff_csv(_head_bytes(source))
+    # utf-8 sai byte => báo lỗi; bảng mã 1 byte: byte không định nghĩa => thay thế, không dừng cả file
+    return {"encoding": enc, "sep": sep, "encoding_errors": "strict" if enc.startswith("utf") else "replace"}
+
+def _nfc_frame(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [_nfc(c) for c in df.columns]
+    for c in df.columns:
+        df[c] = df[c].str.normalize("NFC")
+    return df
+
+def _xlsx_columns(header) -> list[str]:
+    return [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+
+def read_header(source, sheet: str | None = None) -> list[str]:
+    # tên cột (đúng như iter_table_chunks trả về); file rỗng => []
+    name = _source_name(source)
+    if name.endswith(".csv"):
+        opts = _csv_options(source)
+        try:
+            cols = pd.read_csv(source, dtype=str, nrows=0, **opts).columns
+        except pd.errors.EmptyDataError:
+            return []
+        finally:
+            _rewind(source)
+        return [_nfc(c) for c in cols] if opts["encoding"] == LEGACY_ENCODING else list(cols)
+    _rewind(source)
+    if name.endswith(".xlsx"):
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0] if sheet is None else wb[sheet]
+            header = next(ws.iter_rows(max_row=1, values_only=True), None)
+        finally:
+            wb.close()
+        return _xlsx_columns(header) if header else []
+    return list(pd.read_excel(source, nrows=0, sheet_name=0 if sheet is None else sheet).columns)
+
+def sheet_names(source) -> list[str | None]:
+    # các sheet theo thứ tự trong workbook; CSV => [None]
+    name = _source_name(source)
+    if name.endswith(".csv"):
+        return [None]
+    _rewind(source)
+    if name.endswith(".xlsx"):
+        wb = openpyxl.load_workbook(source, read_only=True)
+        try:
+            return list(wb.sheetnames)
+        finally:
+            wb.close()
+    return list(pd.ExcelFile(source).sheet_names)
+
+def iter_table_chunks(uploaded, chunksize: int = CHUNK_ROWS, nrows: int | None = None,
+                      usecols: set | None = None, sheet: str | None = None):
+    name = _source_name(uploaded)
+    if name.endswith(".csv"):
+        opts = _csv_options(uploaded)
+        legacy = opts["encoding"] == LEGACY_ENCODING
+        pick = None
+        if usecols is not None:
+            pick = (lambda c: _nfc(c) in usecols) if legacy else (lambda c: c in usecols)
+        reader = pd.read_csv(uploaded, dtype=str, usecols=pick, chunksize=chunksize, nrows=nrows, **opts)
+        for chunk in reader:
+            yield _nfc_frame(chunk) if legacy else chunk
+        return
+    _rewind(uploaded)
+    if name.endswith(".xlsx"):
+        yield from _iter_xlsx_chunks(uploaded, chunksize, nrows, usecols, sheet)
+    else:
+        # .xls (xlrd) không đọc streaming được
+        df = pd.read_excel(uploaded, nrows=nrows, sheet_name=0 if sheet is None else sheet,
+                           usecols=(lambda c: c in usecols) if usecols is not None else None)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+def _iter_xlsx_chunks(f, chunksize: int, nrows: int | None, usecols: set | None = None, sheet: str | None = None):
+    # dòng trống hoàn toàn bị bỏ qua
+    wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0] if sheet is None else wb[sheet]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        cols = _xlsx_columns(header)
+        width = len(cols)
+        # chỉ giữ cột cần (tên trùng => lấy cột đầu, như find_header)
+        keep = list(range(width))
+        if usecols is not None:
+            first = {}
+            for i, c in enumerate(cols):
+                first.setdefault(c, i)
+            keep = [i for c, i in first.items() if c in usecols]
+        out_cols = [cols[i] for i in keep]
+        buf, idx = [], []
+        for pos, r in enumerate(rows):
+            if nrows is not None and pos >= nrows:
+                break
+            if all(v is None for v in r):
+                continue
+            buf.append(tuple(r[i] if i < len(r) else None for i in keep))
+            idx.append(pos)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=out_cols, index=idx)
+                buf, idx = [], []
+        if buf:
+            yield pd.DataFrame(buf, columns=out_cols, index=idx)
+    finally:
+        wb.close()
+
+
+# ========= Loại import (dùng chung UI cache + CLI batch) =========
+IMPORT_KINDS = {
+    # kind -> (header map, map 1 chunk, index +2 = số dòng trong file)
+    "projects": (add_project_column_map, map_add_project_columns, 2),
+    "logistics": (logistics_column_map, map_import_logistics_columns, 0),
+}
+
+def iter_mapped_chunks(source, kind: str, chunksize: int = CHUNK_ROWS, sheet: str | None = None):
+    # từng chunk đã map theo loại import; thiếu cột bắt buộc => ValueError (trước khi đọc dữ liệu)
+    column_map, map_chunk, line_offset = IMPORT_KINDS[kind]
+    header = read_header(source, sheet)
+    if not header:
+        return
+    cols = column_map(header)
+    usecols = {c for c in cols.values() if c is not None}
+    # parse: thời gian đọc từng chunk từ file (CSV / XLSX), rows => dòng/s
+    chunks = iter_table_chunks(source, chunksize, usecols=usecols, sheet=sheet)
+    for chunk in perf.timed_iter(chunks, "parse", f"read {kind}"):
+        mapped = map_chunk(chunk, cols)
+        mapped.index = mapped.index + line_offset
+        yield mapped
+
+def read_mapped(source, kind: str, sheet: str | None = None) -> pd.DataFrame:
+    # đọc + map cả file (1 sheet) theo loại import
+    parts = list(iter_mapped_chunks(source, kind, sheet=sheet))
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts) if len(parts) > 1 else parts[0]
+
+
+# ========= Nhiều file / nhiều sheet =========
+# - Mỗi phần = (file, sheet); parse + map song song ở process con, ghép lại ĐÚNG thứ tự
+#   file (thứ tự truyền vào) rồi sheet (thứ tự trong workbook) => logistics: phần sau ghi đè phần trước
+# - all_sheets: sheet không map được (thiếu cột bắt buộc / không có cột nào khớp) bị bỏ qua
+# - index giữ số dòng trong file/sheet của từng phần (có thể trùng giữa các phần)
+#   => hơn 1 phần: thêm cột SOURCE_COLUMN ("file / sheet"); dòng projects bị loại ghi kèm nguồn
+# - Process con tạo bằng spawn: app Streamlit nhiều thread => fork không an toàn
+# - Khối lượng nhỏ (< PARSE_PARALLEL_MIN_BYTES) => parse tuần tự, khởi động process tốn hơn parse
+#   (Excel nén zip + openpyxl chậm: 1 byte xlsx tính bằng EXCEL_PARSE_COST byte CSV)
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+PARSE_PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+EXCEL_PARSE_COST = 20
+
+def _portable(source):
+    # file upload -> (tên, bytes) gửi được sang process con; đường dẫn giữ nguyên
+    if hasattr(source, "getvalue"):
+        return (str(source.name), source.getvalue())
+    return source
+
+def _open_portable(source):
+    if isinstance(source, tuple):
+        f = io.BytesIO(source[1])
+        f.name = source[0]
+        return f
+    return source
+
+def _parse_cost(source) -> int:
+    size = len(source[1]) if isinstance(source, tuple) else os.path.getsize(source)
+    name = source[0] if isinstance(source, tuple) else str(source)
+    return size if name.lower().endswith(".csv") else size * EXCEL_PARSE_COST
+
+def _source_label(source) -> str:
+    if isinstance(source, tuple):
+        return source[0]
+    return os.path.basename(str(getattr(source, "name", source)))
+
+def _part_label(name: str, sheet: str | None) -> str:
+    return name if sheet is None else f"{name} / {sheet}"
+
+def table_parts(sources, all_sheets: bool = False) -> list[tuple]:
+    # (file, sheet) theo thứ tự file rồi thứ tự sheet; all_sheets=False / CSV => (file, None)
+    return [(s, sheet) for s in sources
+            for sheet in (sheet_names(_open_portable(s)) if all_sheets else [None])]
+
+def _part_mapped(source, sheet: str | None, kind: str) -> bool:
+    # header của sheet map được (đủ cột bắt buộc, có ít nhất 1 cột khớp)
+    header = read_header(source, sheet)
+    if not header:
+        return False
+    try:
+        cols = IMPORT_KINDS[kind][0](header)
+    except ValueError:
+        return False
+    return any(c is not None for c in cols.values())
+
+def _read_part(source, sheet: str | None, kind: str, skip_unmapped: bool, label: str | None) -> pd.DataFrame | None:
+    # chạy trong process con (hoặc tại chỗ); None = sheet bị bỏ qua
+    source = _open_portable(source)
+    if skip_unmapped and not _part_mapped(source, sheet, kind):
+        return None
+    frame = read_mapped(source, kind, sheet)
+    if label is not None and len(frame.columns):
+        frame[SOURCE_COLUMN] = label
+    return frame
+
+def read_mapped_many(sources, kind: str, all_sheets: bool = False, workers: int = PARSE_WORKERS) -> pd.DataFrame:
+    # sources: file upload / đường dẫn; all_sheets=False => sheet đầu mỗi file
+    sources = [_portable(s) for s in sources]
+    parts = table_parts(sources, all_sheets)
+    skip = all_sheets and len(parts) > 1
+    labels = [_part_label(_source_label(s), sheet) if len(parts) > 1 else None for s, sheet in parts]
+    cost = sum(_parse_cost(s) for s in sources)
+    with perf.stage("parse", f"read {kind} x{len(parts)}") as stage:
+        if workers <= 1 or len(parts) <= 1 or cost < PARSE_PARALLEL_MIN_BYTES:
+            frames = [_read_part(s, sheet, kind, skip, label) for (s, sheet), label in zip(parts, labels)]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(parts)),
+                                     mp_context=multiprocessing.get_context("spawn")) as ex:
+                frames = list(ex.map(_read_part, *zip(*parts), repeat(kind), repeat(skip), labels))
+        frames = [f for f in frames if f is not None and len(f.columns)]
+        if not frames:
+            if skip:
+                raise ValueError("Không có sheet nào có header hợp lệ.")
+            return pd.DataFrame()
+        out = pd.concat(frames) if len(frames) > 1 else frames[0]
+        stage.rows = len(out)
+    return out
+
+def iter_mapped_chunks_many(sources, kind: str, all_sheets: bool = False, chunksize: int = CHUNK_ROWS,
+                            names: list[str] | None = None):
+    # bản streaming của read_mapped_many (tuần tự, RAM ~ 1 chunk), cùng thứ tự dòng; gom đủ chunksize dòng
+    # qua ranh giới file/sheet => chunk k trùng frame.iloc[k*chunksize:(k+1)*chunksize] của read_mapped_many
+    # (job chạy tiếp theo checkpoint = số chunk, dù lần trước chạy trên frame đã ghép hay trên file)
+    # names: tên file gốc cho cột nguồn (file đã lưu lại dưới tên khác, vd file của job)
+    names = names or [_source_label(s) for s in sources]
+    parts = [(names[i], source, sheet) for i, s in enumerate(sources)
+             for source, sheet in table_parts([_open_portable(_portable(s))], all_sheets)]
+    skip = all_sheets and len(parts) > 1
+    buf, n, found = [], 0, False
+    for name, source, sheet in parts:
+        if skip and not _part_mapped(source, sheet, kind):
+            continue
+        found = True
+        for chunk in iter_mapped_chunks(source, kind, chunksize, sheet):
+            if len(parts) > 1:
+                chunk[SOURCE_COLUMN] = _part_label(name, sheet)
+            while len(chunk):
+                take = chunk.iloc[:chunksize - n]
+                chunk = chunk.iloc[len(take):]
+                buf.append(take)
+                n += len(take)
+                if n == chunksize:
+                    yield pd.concat(buf) if len(buf) > 1 else buf[0]
+                    buf, n = [], 0
+    if skip and not found:
+        raise ValueError("Không có sheet nào có header hợp lệ.")
+    if buf:
+        yield pd.concat(buf) if len(buf) > 1 else buf[0]
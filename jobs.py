@@ -0,0 +1,277 @@
+# jobs.py
+# Job chạy nền cho import file (projects / logistics) và bulk status — UI không bị khoá trong lúc chạy
+#
+# Lưu ý:
+# - Thread pool 1 worker: job chạy lần lượt theo thứ tự submit (logistics: job sau ghi đè job trước như import tay)
+# - Mỗi chunk commit riêng, checkpoint ghi CÙNG transaction với dữ liệu => chạy tiếp không ghi trùng / không sót
+# - Ghi qua writer thread của pool: chunk = submit_exclusive (transaction riêng), cập nhật trạng thái job = submit
+#   (gộp commit với thao tác nhỏ khác); chuẩn hoá pandas của chunk chạy NGOÀI transaction
+# - File upload được lưu xuống JOBS_DIR để chạy tiếp sau khi process dừng giữa chừng (xoá khi job xong)
+# - Viewer vẫn đọc bình thường (WAL); khoá ghi chỉ giữ trong từng chunk
+# - Tiến độ (dòng, dòng/s) đọc từ bảng jobs => UI poll bằng st.fragment(run_every=...)
+# - APP_PERF_LOG bật => mỗi lần chạy job ghi 1 dòng perf (parse / pandas / SQL / dòng/s từng chunk)
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+
+import perf
+from db import LATEST_UPDATE_S4_FORMAT, ConnectionPool, set_latest_update_s4
+from ingest import (
+    CHUNK_ROWS, insert_projects, iter_mapped_chunks, iter_mapped_chunks_many, merge_logistics, prepare_logistics,
+    prepare_projects,
+)
+from status import log_status_bulk_chunk
+
+JOBS_DIR = "jobs"
+JOB_WORKERS = 1
+REJECT_KEEP = 1000       # số dòng bị loại giữ lại trong result để hiển thị
+FILE_KINDS = ("projects", "logistics")
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M")
+
+def estimate_rows(path: str) -> int | None:
+    # ước lượng nhanh số dòng dữ liệu (cho thanh tiến độ); không chính xác tuyệt đối là chấp nhận được
+    name = path.lower()
+    if name.endswith(".csv"):
+        n, last = 0, b"\n"
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                n += block.count(b"\n")
+                last = block[-1:]
+        return max(0, n - 1 + (last != b"\n"))
+    if name.endswith(".xlsx"):
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            max_row = wb.worksheets[0].max_row
+        finally:
+            wb.close()
+        return max(0, max_row - 1) if max_row else None
+    return None
+
+def _update_job(conn, job_id: int, **fields):
+    sets = ", ".join(f"{k}=?" for k in fields)
+    conn.execute(f"UPDATE jobs SET {sets} WHERE job_id=?", (*fields.values(), job_id))
+
+def get_jobs(conn, job_ids: list[int]) -> list[dict]:
+    if not job_ids:
+        return []
+    cur = conn.execute(f"SELECT * FROM jobs WHERE job_id IN ({','.join('?' * len(job_ids))}) ORDER BY job_id", job_ids)
+    cols = [d[0] for d in cur.description]
+    jobs = []
+    for row in cur:
+        job = dict(zip(cols, row))
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else {}
+        jobs.append(job)
+    return jobs
+
+def job_rate(job: dict) -> float:
+    # dòng / giây (tính trên thời gian chạy thật, cộng dồn qua các lần resume)
+    return job["done_rows"] / job["elapsed_s"] if job["elapsed_s"] > 0 else 0.0
+
+def job_fraction(job: dict) -> float:
+    if job["status"] == "done":
+        return 1.0
+    if not job["total_rows"]:
+        return 0.0
+    return min(1.0, job["done_rows"] / job["total_rows"])
+
+
+class JobRunner:
+    def __init__(self, pool: ConnectionPool, workers: int = JOB_WORKERS, jobs_dir: str = JOBS_DIR):
+        self.pool = pool
+        self.jobs_dir = jobs_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        # frame đã parse sẵn (upload cache) cho job đang chờ: khỏi đọc lại file
+        self._frames: dict[int, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    # ---------- submit ----------
+    def submit_file(self, kind: str, uploaded, frame: pd.DataFrame | None = None) -> int:
+        # kind: projects | logistics; frame: bản đã map (nếu có) => không parse lại
+        assert kind in FILE_KINDS
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        suffix = os.path.splitext(uploaded.name)[1].lower()
+        job_id = self.pool.run_write(self._insert_job, kind, {}, uploaded.name, None)
+        # lưu file ngoài transaction (không giữ writer lâu); dừng giữa chừng => job không có file => lỗi, không treo
+        path = os.path.join(self.jobs_dir, f"job_{job_id}{suffix}")
+        with open(path, "wb") as f:
+            f.write(uploaded.getvalue())
+        total = len(frame) if frame is not None else estimate_rows(path)
+        self.pool.run_write(_update_job, job_id, source_path=path, total_rows=total)
+        if frame is not None:
+            with self._lock:
+                self._frames[job_id] = frame
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def submit_files(self, kind: str, uploads: list, all_sheets: bool = False,
+                     frame: pd.DataFrame | None = None) -> int:
+        # nhiều file / mọi sheet: frame = bản đã ghép (UploadCache.get_parsed_many) nếu còn trong cache,
+        # không có => job stream lại các file (ingest.iter_mapped_chunks_many, cùng cách chia chunk)
+        assert kind in FILE_KINDS
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        name = ", ".join(u.name for u in uploads)
+        job_id = self.pool.run_write(self._insert_job, kind, {"all_sheets": all_sheets}, name, None)
+        paths = []
+        for k, u in enumerate(uploads):
+            path = os.path.join(self.jobs_dir, f"job_{job_id}_{k}{os.path.splitext(u.name)[1].lower()}")
+            with open(path, "wb") as f:
+                f.write(u.getvalue())
+            paths.append(path)
+        # total ước lượng (sheet đầu mỗi file) khi không có frame; xong job => total = số dòng thật
+        total = len(frame) if frame is not None else sum(estimate_rows(p) or 0 for p in paths)
+        params = json.dumps({"all_sheets": all_sheets, "files": paths, "names": [u.name for u in uploads]},
+                            ensure_ascii=False)
+        self.pool.run_write(_update_job, job_id, params=params, total_rows=total)
+        if frame is not None:
+            with self._lock:
+                self._frames[job_id] = frame
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def submit_bulk_status(self, filters: dict, status_text: str, note: str | None,
+                           updated_by: str, total_rows: int | None = None) -> int:
+        # thời điểm ghi cố định lúc submit => mọi log của job (kể cả sau resume) cùng updated_at
+        params = {"filters": filters, "status_text": status_text, "note": note,
+                  "updated_by": updated_by, "now": _now()}
+        job_id = self.pool.run_write(self._insert_job, "bulk_status", params, None, total_rows)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def resume(self, job_id: int):
+        # chạy tiếp từ checkpoint (job lỗi hoặc bị dừng giữa chừng)
+        self.pool.run_write(_update_job, job_id, status="queued", message=None)
+        self._executor.submit(self._run, job_id)
+
+    def resume_pending(self) -> list[int]:
+        # gọi 1 lần khi khởi động: job queued/running của process trước => chạy tiếp
+        with self.pool.read() as conn:
+            ids = [r[0] for r in conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN ('queued','running') ORDER BY job_id"
+            )]
+        for job_id in ids:
+            self._executor.submit(self._run, job_id)
+        return ids
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    @staticmethod
+    def _insert_job(conn, kind: str, params: dict, source_name: str | None, total_rows: int | None) -> int:
+        cur = conn.execute("""
+            INSERT INTO jobs(kind, status, source_name, params, total_rows, created_at)
+            VALUES (?, 'queued', ?, ?, ?, ?)
+        """, (kind, source_name, json.dumps(params, ensure_ascii=False), total_rows, _now()))
+        return cur.lastrowid
+
+    # ---------- chạy ----------
+    def _run(self, job_id: int):
+        with self._lock:
+            frame = self._frames.pop(job_id, None)
+        with self.pool.read() as conn:
+            jobs = get_jobs(conn, [job_id])
+        if not jobs or jobs[0]["status"] == "done":
+            return
+        job = jobs[0]
+        self.pool.run_write(_update_job, job_id, status="running")
+        try:
+            with perf.recording(f"job {job['kind']}", enabled=perf.PERF_LOG is not None, job_id=job_id):
+                if job["kind"] == "bulk_status":
+                    self._run_bulk_status(job)
+                else:
+                    self._run_file(job, frame)
+        except Exception as e:
+            self.pool.run_write(_update_job, job_id, status="error", message=str(e), finished_at=_now())
+
+    def _checkpoint(self, conn, job: dict, checkpoint: int, rows: int, result: dict, seconds: float):
+        # gọi trong cùng transaction với dữ liệu của chunk
+        job["checkpoint"] = checkpoint
+        job["done_rows"] += rows
+        job["elapsed_s"] += seconds
+        conn.execute("""
+            UPDATE jobs SET checkpoint=?, done_rows=?, elapsed_s=?, result=? WHERE job_id=?
+        """, (checkpoint, job["done_rows"], job["elapsed_s"], json.dumps(result, ensure_ascii=False), job["job_id"]))
+
+    def _file_chunks(self, job: dict, frame: pd.DataFrame | None):
+        # cùng cách chia chunk cho frame có sẵn và file trên đĩa => checkpoint (số chunk) dùng được cho cả 2
+        if frame is not None:
+            for start in range(0, len(frame), CHUNK_ROWS):
+                yield frame.iloc[start:start + CHUNK_ROWS]
+        elif "files" in job["params"]:
+            files = job["params"]["files"]
+            if not all(os.path.exists(p) for p in files):
+                raise FileNotFoundError(f"Không còn file nguồn của job: {job['source_name']}")
+            yield from iter_mapped_chunks_many(files, job["kind"], job["params"]["all_sheets"], CHUNK_ROWS,
+                                               job["params"].get("names"))
+        else:
+            if not job["source_path"] or not os.path.exists(job["source_path"]):
+                raise FileNotFoundError(f"Không còn file nguồn của job: {job['source_name']}")
+            yield from iter_mapped_chunks(job["source_path"], job["kind"], CHUNK_ROWS)
+
+    def _run_file(self, job: dict, frame: pd.DataFrame | None):
+        kind = job["kind"]
+        result = job["result"] or (
+            {"updated": 0} if kind == "logistics" else {"created": 0, "rejected": 0, "rejected_rows": []}
+        )
+        for i, chunk in enumerate(self._file_chunks(job, frame)):
+            if i < job["checkpoint"]:
+                continue
+            t0 = time.perf_counter()
+            with perf.stage("import", f"{kind} chunk", len(chunk)):
+                # chuẩn hoá (pandas) trước, writer thread chỉ chạy phần ghi SQLite
+                staged = prepare_logistics(chunk) if kind == "logistics" else prepare_projects(chunk)
+                self.pool.submit_exclusive(self._apply_chunk, job, i + 1, len(chunk), staged, result, t0).result()
+        self.pool.run_write(self._finish, job)
+        for path in [job["source_path"], *job["params"].get("files", [])]:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def _apply_chunk(self, conn, job: dict, checkpoint: int, rows: int, staged, result: dict, t0: float):
+        # chạy trên writer thread, 1 transaction / chunk
+        if job["kind"] == "logistics":
+            # merge tuần tự từng chunk + COALESCE = last-write-wins như merge cả file
+            _, updated = merge_logistics(conn, staged)
+            result["updated"] += updated
+        else:
+            valid, rejected = staged
+            ids = insert_projects(conn, valid)
+            result["created"] += len(ids)
+            result["rejected"] += len(rejected)
+            room = REJECT_KEEP - len(result["rejected_rows"])
+            if room > 0 and len(rejected):
+                result["rejected_rows"] += [[int(n), str(r)] for n, r in rejected.head(room).itertuples(index=False)]
+        self._checkpoint(conn, job, checkpoint, rows, result, time.perf_counter() - t0)
+
+    def _finish(self, conn, job: dict):
+        if job["kind"] == "logistics":
+            set_latest_update_s4(conn, datetime.now().strftime(LATEST_UPDATE_S4_FORMAT))
+        conn.execute("UPDATE jobs SET status='done', total_rows=done_rows, finished_at=? WHERE job_id=?",
+                     (_now(), job["job_id"]))
+
+    def _run_bulk_status(self, job: dict):
+        p = job["params"]
+        result = job["result"] or {"logged": 0}
+        after = job["checkpoint"]
+        while after is not None:
+            after = self.pool.submit_exclusive(self._bulk_chunk, job, p, after, result, time.perf_counter()).result()
+
+    def _bulk_chunk(self, conn, job: dict, p: dict, after: int, result: dict, t0: float) -> int | None:
+        # 1 chunk (1 transaction); trả checkpoint mới, None = xong
+        n, last = log_status_bulk_chunk(conn, p["filters"], p["status_text"], p["note"],
+                                        p["updated_by"], p["now"], after, CHUNK_ROWS)
+        if last is None:
+            self._finish(conn, job)
+            return None
+        result["logged"] += n
+        self._checkpoint(conn, job, last, n, result, time.perf_counter() - t0)
+        return last
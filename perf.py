@@ -0,0 +1,241 @@
+# perf.py
+# Đo thời gian các đường nóng (câu SQL, bước pandas, parse file, import dòng/s) — bật khi cần
+#
+# Lưu ý:
+# - Mỗi lần chạy (1 rerun Streamlit / 1 job nền / 1 file batch) = 1 Recorder gắn vào context hiện tại (ContextVar)
+#   => số liệu các session / thread job không lẫn vào nhau
+# - Không có Recorder (mặc định): stage() trả về 1 object rỗng dùng chung, cursor SQL chỉ đọc 1 ContextVar
+#   => chi phí khi tắt gần như bằng 0
+# - SQL: connection của pool (db._connect) dùng TimedConnection / TimedCursor
+#   đo execute/executemany ("sql") + fetchall/fetchmany ("fetch"); duyệt cursor từng dòng không đo riêng
+# - Stage có thể lồng nhau (vd "query" bao các câu "sql" bên trong) => không cộng dồn các dòng summary
+# - APP_PERF_LOG=<file>: mỗi Recorder xong ghi 1 dòng JSON (summary theo bước) => phân tích offline
+
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+PERF_LOG = os.environ.get("APP_PERF_LOG") or None
+SQL_LABEL_MAX = 120      # độ dài tối đa câu SQL trong summary
+
+_current: ContextVar = ContextVar("perf_recorder", default=None)
+_log_lock = threading.Lock()
+
+
+class Recorder:
+    def __init__(self, name: str, **meta):
+        self.name = name
+        self.meta = meta
+        self.ts = datetime.now().isoformat(timespec="seconds")
+        self.events: list[tuple] = []      # (kind, name, seconds, rows | None)
+        self.seconds: float | None = None
+        self._t0 = time.perf_counter()
+
+    def add(self, kind: str, name: str, seconds: float, rows: int | None = None):
+        self.events.append((kind, name, seconds, rows))
+
+    def summary(self) -> list[dict]:
+        # gộp theo (kind, name), sắp theo tổng thời gian giảm dần
+        agg = {}
+        for kind, name, seconds, rows in self.events:
+            a = agg.setdefault((kind, name), {"kind": kind, "name": name, "calls": 0, "ms": 0.0, "rows": None})
+            a["calls"] += 1
+            a["ms"] += seconds * 1000
+            if rows is not None:
+                a["rows"] = (a["rows"] or 0) + rows
+        out = sorted(agg.values(), key=lambda a: a["ms"], reverse=True)
+        for a in out:
+            a["ms"] = round(a["ms"], 3)
+            a["rows_per_s"] = round(a["rows"] / a["ms"] * 1000, 1) if a["rows"] and a["ms"] > 0 else None
+        return out
+
+    def total_ms(self, kind: str) -> float:
+        return sum(e[2] for e in self.events if e[0] == kind) * 1000
+
+    def to_dict(self) -> dict:
+        return {"ts": self.ts, "run": self.name, **self.meta,
+                "seconds": None if self.seconds is None else round(self.seconds, 6),
+                "stages": self.summary()}
+
+
+class _Stage:
+    __slots__ = ("rec", "kind", "name", "rows", "_t0")
+
+    def __init__(self, rec: Recorder, kind: str, name: str, rows: int | None):
+        self.rec, self.kind, self.name, self.rows = rec, kind, name, rows
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.rec.add(self.kind, self.name, time.perf_counter() - self._t0, self.rows)
+        return False
+
+
+class _NullStage:
+    # dùng chung khi không đo; gán .rows / .kind lên đây vô hại (không ai đọc)
+    kind = name = rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+def active() -> Recorder | None:
+    return _current.get()
+
+def stage(kind: str, name: str, rows: int | None = None):
+    # with perf.stage("pandas", "prepare_projects", rows=len(df)) as s: ... (s.rows gán sau cũng được)
+    rec = _current.get()
+    if rec is None:
+        return _NULL
+    return _Stage(rec, kind, name, rows)
+
+def timed(kind: str, rows_arg: int | None = None):
+    # decorator cho hàm 1 bước (pandas / import): tên bước = tên hàm, rows = len(tham số thứ rows_arg)
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rec = _current.get()
+            if rec is None:
+                return fn(*args, **kwargs)
+            rows = len(args[rows_arg]) if rows_arg is not None and len(args) > rows_arg else None
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                rec.add(kind, fn.__name__, time.perf_counter() - t0, rows)
+        return wrapper
+    return deco
+
+def timed_iter(iterable, kind: str, name: str):
+    # đo thời gian lấy từng phần tử (vd chunk đọc từ file), rows = len(phần tử)
+    if _current.get() is None:
+        return iterable
+    return _timed_iter(iterable, kind, name)
+
+def _timed_iter(iterable, kind: str, name: str):
+    it = iter(iterable)
+    while True:
+        with stage(kind, name) as s:
+            item = next(it, _NULL)
+            if item is not _NULL:
+                s.rows = len(item)
+        if item is _NULL:
+            return
+        yield item
+
+def start(name: str, **meta) -> Recorder:
+    rec = Recorder(name, **meta)
+    _current.set(rec)
+    return rec
+
+def reset():
+    # gỡ Recorder đang gắn vào context (lần chạy trước dừng giữa chừng, không tới finish)
+    _current.set(None)
+
+def finish(rec: Recorder) -> Recorder:
+    # gỡ khỏi context (fragment rerun sau đó không ghi thêm vào đây) + ghi log nếu bật
+    rec.seconds = time.perf_counter() - rec._t0
+    if _current.get() is rec:
+        _current.set(None)
+    if PERF_LOG:
+        write_log(rec, PERF_LOG)
+    return rec
+
+@contextmanager
+def recording(name: str, enabled: bool = True, **meta):
+    # cho job nền / batch: with perf.recording("job logistics", enabled=perf.PERF_LOG is not None): ...
+    if not enabled:
+        yield None
+        return
+    prev = _current.get()
+    rec = start(name, **meta)
+    try:
+        yield rec
+    finally:
+        finish(rec)
+        _current.set(prev)
+
+def write_log(rec: Recorder, path: str):
+    line = json.dumps(rec.to_dict(), ensure_ascii=False)
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+# ========= SQLite =========
+def sql_label(sql: str) -> str:
+    return " ".join(sql.split())[:SQL_LABEL_MAX]
+
+def _rows(cur) -> int | None:
+    return cur.rowcount if cur.rowcount >= 0 else None
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=(), /):
+        rec = _current.get()
+        if rec is None:
+            return super().execute(sql, parameters)
+        self._perf_label = sql_label(sql)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            rec.add("sql", self._perf_label, time.perf_counter() - t0, _rows(self))
+
+    def executemany(self, sql, seq_of_parameters, /):
+        rec = _current.get()
+        if rec is None:
+            return super().executemany(sql, seq_of_parameters)
+        label = sql_label(sql)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            rec.add("sql", label, time.perf_counter() - t0, _rows(self))
+
+    def fetchall(self):
+        rec = _current.get()
+        if rec is None:
+            return super().fetchall()
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        rec.add("fetch", getattr(self, "_perf_label", "?"), time.perf_counter() - t0, len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        rec = _current.get()
+        if rec is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        rec.add("fetch", getattr(self, "_perf_label", "?"), time.perf_counter() - t0, len(rows))
+        return rows
+
+
+class TimedConnection(sqlite3.Connection):
+    # sqlite3.connect(..., factory=TimedConnection); Connection.execute (C) không đi qua cursor() => override cả 2
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        if _current.get() is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        if _current.get() is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,225 @@
+# queries.py
+# Query builder cho Tab 1 (Projects): filter -> WHERE có tham số, ORDER BY + LIMIT/OFFSET
+#
+# Lưu ý:
+# - Filter = "contains" không phân biệt hoa/thường, kể cả chữ có dấu => casefold(cột) LIKE '%x%' (db._casefold)
+# - Ký tự đặc biệt của LIKE (% _ \) trong từ khoá được escape
+# - Từ khoá >= 3 ký tự đi qua index trigram projects_fts (xem db.init_fts); ngắn hơn => LIKE thường
+# - Sort mặc định: Last updated (row_created_at, mới -> cũ); format "%Y-%m-%d %H:%M" sort chuỗi = sort thời gian
+# - Khoảng ngày S4: so sánh trên cột ISO generated (db.S4_DATE_COLUMNS) => range scan theo index
+# - Current status: đọc từ project_current_status (trigger giữ sẵn), join theo PRIMARY KEY
+# - Picker dự án (Quick PI, C1): tìm server-side, LIMIT nhỏ => không đẩy cả bảng vào selectbox
+# - Trang Tab 1: đổi tên cột hiển thị tại chỗ (không copy thêm bản "display"); trang nhỏ => giữ kiểu đọc từ SQLite
+# - Summary: chỉ đọc bảng rollup (db.init_rollups, trigger giữ sẵn) => không phụ thuộc số dòng projects
+
+from datetime import date
+from sqlite3 import Connection
+
+import pandas as pd
+
+from db import FTS_COLUMNS, ROLLUP_DIMS, S4_DATE_COLUMNS
+
+# Column order locked (Tab 1): cột DB -> header hiển thị
+PROJECT_DISPLAY_COLUMNS = {
+    "si": "SI",
+    "eu": "EU",
+    "dgw_pic": "DGW PIC",
+    "asus_pic": "Asus PIC",
+    "row_created_at": "Last updated",
+    "sku_code": "Mã hàng",
+    "partnumber": "Partnumber",
+    "qty": "Qty",
+    "price_vnd": "Giá",
+    "pi_no": "PI",
+    "lot_no": "Số lô",
+    "bill_no": "Bill",
+    "declaration_no": "Số tờ khai",
+    "s4_in_warehouse_date": "S4 đến kho",
+    "s4_arrival_port_date": "S4 cập cảng",
+    "s4_departure_date": "S4 đi",
+    "current_status": "Current status",
+}
+
+# cột không nằm trong projects => biểu thức SELECT riêng (join project_current_status AS cs)
+PROJECT_SELECT_EXPR = {
+    "current_status": "cs.status_text AS current_status",
+}
+
+# các cột được phép filter (key filter = tên cột DB)
+PROJECT_FILTER_COLUMNS = [
+    "si", "eu", "dgw_pic", "asus_pic", "sku_code",
+    "partnumber", "pi_no", "lot_no", "bill_no", "declaration_no",
+]
+
+PROJECT_ORDER_BY = "row_created_at DESC, project_id DESC"
+
+# trigram cần tối thiểu 3 ký tự để dùng index
+FTS_MIN_LEN = 3
+
+PICKER_LIMIT = 50
+PICKER_SEARCH_COLUMNS = ["sku_code", "partnumber", "pi_no"]
+PICKER_LABEL_SQL = (
+    "project_id || ' | ' || sku_code || ' | ' || COALESCE(partnumber, '')"
+    " || ' | PI=' || COALESCE(NULLIF(pi_no, ''), '-')"
+)
+
+
+def like_pattern(keyword: str) -> str:
+    # đã casefold => dùng với like_sql()
+    kw = str(keyword).strip().casefold().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{kw}%"
+
+def like_sql(col: str) -> str:
+    return f"casefold({col}) LIKE ? ESCAPE '\\'"
+
+def fts_phrase(keyword: str) -> str:
+    return '"' + str(keyword).strip().replace('"', '""') + '"'
+
+def iso_date(d: date | str) -> str:
+    return d.isoformat() if isinstance(d, date) else str(d)
+
+def build_project_where(filters: dict, search: str | None = None,
+                        dates: dict | None = None) -> tuple[str, list]:
+    # filters: {cột DB: từ khoá}; từ khoá rỗng/None bỏ qua
+    # search: "tìm tất cả" — khớp ở bất kỳ cột nào trong FTS_COLUMNS
+    # dates: {cột ngày S4: (từ ngày, đến ngày)} — date | None, tính cả 2 đầu
+    # filters["current_status"]: contains trên trạng thái mới nhất
+    # trigram: phrase "xyz" = chứa chuỗi con xyz => gộp thành 1 biểu thức MATCH
+    clauses = []
+    params = []
+    fts_terms = []
+    for col in PROJECT_FILTER_COLUMNS:
+        kw = filters.get(col)
+        if kw is None or str(kw).strip() == "":
+            continue
+        if col in FTS_COLUMNS and len(str(kw).strip()) >= FTS_MIN_LEN:
+            fts_terms.append(f"{{{col}}} : {fts_phrase(kw)}")
+        else:
+            clauses.append(like_sql(col))
+            params.append(like_pattern(kw))
+    if search is not None and str(search).strip() != "":
+        if len(str(search).strip()) >= FTS_MIN_LEN:
+            fts_terms.append(fts_phrase(search))
+        else:
+            clauses.append("(" + " OR ".join(like_sql(c) for c in FTS_COLUMNS) + ")")
+            params.extend([like_pattern(search)] * len(FTS_COLUMNS))
+    status = filters.get("current_status")
+    if status is not None and str(status).strip() != "":
+        clauses.append(f"project_id IN (SELECT project_id FROM project_current_status WHERE {like_sql('status_text')})")
+        params.append(like_pattern(status))
+    for col, (start, end) in (dates or {}).items():
+        iso_col = S4_DATE_COLUMNS[col]
+        if start is not None:
+            clauses.append(f"{iso_col} >= ?")
+            params.append(iso_date(start))
+        if end is not None:
+            clauses.append(f"{iso_col} <= ?")
+            params.append(iso_date(end))
+    if fts_terms:
+        clauses.insert(0, "projects.rowid IN (SELECT rowid FROM projects_fts WHERE projects_fts MATCH ?)")
+        params.insert(0, " AND ".join(fts_terms))
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+def count_projects(conn: Connection, filters: dict, search: str | None = None,
+                   dates: dict | None = None) -> int:
+    where, params = build_project_where(filters, search, dates)
+    return conn.execute(f"SELECT COUNT(*) FROM projects {where}", params).fetchone()[0]
+
+def project_view_sql(filters: dict, search: str | None = None,
+                     dates: dict | None = None) -> tuple[str, list]:
+    # SELECT project_id + các cột hiển thị (đúng thứ tự lock), filter + sort như Tab 1; chưa LIMIT
+    # dùng chung cho trang Tab 1 và export (export.py)
+    where, params = build_project_where(filters, search, dates)
+    cols = ", ".join(PROJECT_SELECT_EXPR.get(c, c) for c in PROJECT_DISPLAY_COLUMNS)
+    sql = f"""
+        SELECT project_id, {cols}
+        FROM projects LEFT JOIN project_current_status cs USING (project_id)
+        {where} ORDER BY {PROJECT_ORDER_BY}
+    """
+    return sql, params
+
+def fetch_projects_page(conn: Connection, filters: dict, page: int = 1, page_size: int = 100,
+                        search: str | None = None, dates: dict | None = None) -> pd.DataFrame:
+    # chỉ lấy đúng các dòng của trang đang xem, đã đổi sang header hiển thị; index = project_id
+    sql, params = project_view_sql(filters, search, dates)
+    offset = max(0, int(page) - 1) * int(page_size)
+    df = pd.read_sql_query(f"{sql} LIMIT ? OFFSET ?", conn, params=[*params, int(page_size), offset],
+                           index_col="project_id")
+    df.columns = [PROJECT_DISPLAY_COLUMNS.get(c, c) for c in df.columns]
+    return df
+
+def fetch_status_history(conn: Connection, project_id: str) -> pd.DataFrame:
+    # lịch sử trạng thái 1 dự án (mới -> cũ), theo index (project_id, updated_at)
+    return pd.read_sql_query("""
+        SELECT updated_at AS "Thời gian", status_text AS "Status", note AS "Note", updated_by AS "Người cập nhật"
+        FROM status_logs WHERE project_id=?
+        ORDER BY updated_at DESC, log_id DESC
+    """, conn, params=[project_id])
+
+def page_count(total: int, page_size: int) -> int:
+    return max(1, -(-int(total) // int(page_size)))
+
+def search_projects(conn: Connection, keyword: str | None, limit: int = PICKER_LIMIT) -> pd.DataFrame:
+    # -> DataFrame(project_id, label), tối đa `limit` dòng
+    # - rỗng: dự án mới nhất (index row_created_at)
+    # - Project ID: prefix theo PRIMARY KEY (range scan)
+    # - Mã hàng / Partnumber / PI: contains qua index trigram (>= 3 ký tự), ngắn hơn => LIKE
+    # - UNION ALL (IN tự loại trùng) => dừng quét ngay khi đủ `limit` dòng
+    kw = "" if keyword is None else str(keyword).strip()
+    if kw == "":
+        sql = f"SELECT project_id, {PICKER_LABEL_SQL} AS label FROM projects ORDER BY {PROJECT_ORDER_BY} LIMIT ?"
+        return pd.read_sql_query(sql, conn, params=[int(limit)])
+    prefix = kw.upper()
+    parts = ["SELECT rowid FROM projects WHERE project_id >= ? AND project_id < ?"]
+    params = [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    if len(kw) >= FTS_MIN_LEN:
+        parts.append("SELECT rowid FROM projects_fts WHERE projects_fts MATCH ?")
+        params.append(f"{{{' '.join(PICKER_SEARCH_COLUMNS)}}} : {fts_phrase(kw)}")
+    else:
+        parts.append(
+            "SELECT rowid FROM projects WHERE "
+            + " OR ".join(like_sql(c) for c in PICKER_SEARCH_COLUMNS)
+        )
+        params.extend([like_pattern(kw)] * len(PICKER_SEARCH_COLUMNS))
+    sql = f"""
+        SELECT project_id, {PICKER_LABEL_SQL} AS label FROM projects
+        WHERE rowid IN (SELECT rowid FROM ({" UNION ALL ".join(parts)}) LIMIT ?)
+        ORDER BY project_id DESC
+    """
+    return pd.read_sql_query(sql, conn, params=[*params, int(limit)])
+
+
+# ========= Summary (rollup) =========
+ROLLUP_WEEKS = 26        # số tuần gần nhất trên biểu đồ mặc định
+
+def fetch_rollup_totals(conn: Connection) -> dict:
+    # tổng toàn bảng = tổng theo 1 dim bất kỳ (mỗi dòng projects thuộc đúng 1 key / dim)
+    row = conn.execute(
+        "SELECT COALESCE(SUM(n_lines), 0), COALESCE(SUM(qty), 0), COALESCE(SUM(value_vnd), 0) FROM rollup_dims WHERE dim=?",
+        (ROLLUP_DIMS[0],),
+    ).fetchone()
+    return {"n_lines": row[0], "qty": row[1], "value_vnd": row[2]}
+
+def fetch_rollup_dim(conn: Connection, dim: str) -> pd.DataFrame:
+    # tổng theo SI / EU / DGW PIC / Asus PIC, giá trị lớn -> nhỏ
+    if dim not in ROLLUP_DIMS:
+        raise ValueError(f"dim không hợp lệ: {dim}")
+    df = pd.read_sql_query("""
+        SELECT key, n_lines, qty, value_vnd FROM rollup_dims
+        WHERE dim=? AND n_lines > 0 ORDER BY value_vnd DESC, key
+    """, conn, params=[dim])
+    df.columns = [PROJECT_DISPLAY_COLUMNS[dim], "Số dòng", "Qty", "Giá trị (VND)"]
+    return df
+
+def fetch_weekly_arrivals(conn: Connection, weeks: int | None = ROLLUP_WEEKS) -> pd.DataFrame:
+    # số dòng đến cảng / đến kho theo tuần (index = ngày thứ Hai), `weeks` tuần gần nhất (None = tất cả)
+    df = pd.read_sql_query("""
+        SELECT week AS "Tuần",
+               SUM(CASE WHEN event='port' THEN n_lines ELSE 0 END) AS "Đến cảng",
+               SUM(CASE WHEN event='warehouse' THEN n_lines ELSE 0 END) AS "Đến kho"
+        FROM rollup_weekly WHERE n_lines > 0
+        GROUP BY week ORDER BY week DESC LIMIT ?
+    """, conn, params=[-1 if weeks is None else int(weeks)], index_col="Tuần")
+    return df.iloc[::-1]
+
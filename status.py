@@ -0,0 +1,63 @@
+# status.py
+# Ghi status_logs (append-only): Quick PI, C1 By Project, C2 Bulk
+#
+# Lưu ý:
+# - Hàm ghi KHÔNG commit; gọi qua pool.run_write / pool.submit (writer thread) hoặc trong pool.write()
+# - project_current_status tự cập nhật qua trigger (xem db.init_current_status)
+# - Bulk: INSERT ... SELECT theo filter Bill / Số lô / Số tờ khai (như Tab 1: contains, qua index trigram),
+#   từng chunk theo rowid (job bulk_status, xem jobs.py)
+
+from sqlite3 import Connection
+
+import pandas as pd
+
+from queries import build_project_where
+
+BULK_FILTER_COLUMNS = ["bill_no", "lot_no", "declaration_no"]
+BULK_PREVIEW_ROWS = 200
+
+
+def log_status(conn: Connection, project_id: str, status_text: str, note: str | None,
+               updated_by: str, now: str):
+    conn.execute("""
+        INSERT INTO status_logs(project_id,status_text,note,updated_by,updated_at)
+        VALUES (?,?,?,?,?)
+    """, (project_id, status_text, note, updated_by, now))
+
+def update_pi(conn: Connection, project_id: str, pi_no: str, updated_by: str, now: str):
+    # Quick PI: đổi PI + log "Confirmed PI (...)"
+    conn.execute("UPDATE projects SET pi_no=? WHERE project_id=?", (pi_no, project_id))
+    log_status(conn, project_id, f"Confirmed PI ({pi_no})", "", updated_by, now)
+
+def bulk_where(filters: dict) -> tuple[str, list]:
+    return build_project_where({c: filters.get(c) for c in BULK_FILTER_COLUMNS})
+
+def count_bulk_matches(conn: Connection, filters: dict) -> int:
+    where, params = bulk_where(filters)
+    return conn.execute(f"SELECT COUNT(*) FROM projects {where}", params).fetchone()[0]
+
+def fetch_bulk_preview(conn: Connection, filters: dict, limit: int = BULK_PREVIEW_ROWS) -> pd.DataFrame:
+    where, params = bulk_where(filters)
+    sql = f"""
+        SELECT project_id, sku_code, partnumber, bill_no, lot_no, declaration_no
+        FROM projects {where} ORDER BY project_id LIMIT ?
+    """
+    return pd.read_sql_query(sql, conn, params=[*params, int(limit)])
+
+def log_status_bulk_chunk(conn: Connection, filters: dict, status_text: str, note: str | None,
+                          updated_by: str, now: str, after_rowid: int, limit: int) -> tuple[int, int | None]:
+    # ghi log cho `limit` dự án match tiếp theo sau after_rowid (theo rowid projects), 1 câu INSERT ... SELECT
+    # trả (số log đã ghi, rowid cuối của chunk | None nếu hết) — rowid cuối dùng làm checkpoint
+    where, params = bulk_where(filters)
+    where = f"{where} AND projects.rowid > ?" if where else "WHERE projects.rowid > ?"
+    last = conn.execute(
+        f"SELECT MAX(rowid) FROM (SELECT projects.rowid AS rowid FROM projects {where} ORDER BY projects.rowid LIMIT ?)",
+        [*params, after_rowid, int(limit)],
+    ).fetchone()[0]
+    if last is None:
+        return 0, None
+    cur = conn.execute(f"""
+        INSERT INTO status_logs(project_id,status_text,note,updated_by,updated_at)
+        SELECT project_id, ?, ?, ?, ? FROM projects {where} AND projects.rowid <= ?
+    """, [status_text, note, updated_by, now, *params, after_rowid, last])
+    return cur.rowcount, last
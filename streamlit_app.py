@@ -2,6 +2,7 @@
 # Streamlit MVP cho "Track hàng dự án" — theo spec đã lock với bạn
 # Tabs:
 #   1) Projects (Viewer & Editor) — bảng + filter + header "Latest update S4"
+#   Summary (Viewer & Editor) — tổng Qty / giá trị theo SI, EU, PIC + số dòng đến cảng / kho theo tuần (bảng rollup)
 #   2) Add Project (Editor) — Form/Paste/Import với bộ bắt buộc: DGW PIC, ASUS PIC, Mã hàng, Số lượng, Đơn giá FV, SI, EU
 #   3) Editor Tools (Editor) — Quick PI, Import Logistics (map chuẩn), Status Update (By Project & Bulk)
 #
@@ -11,187 +12,158 @@
 # - Sau import, KHÔNG hiện summary; chỉ thông báo “Import thành công”
 # - Chỉ cập nhật "Latest update S4" (timestamp import gần nhất) ở Tab 1; không đổi "last_updated" từng dòng dự án
 # - Bulk Status: filter chỉ Bill / Số lô / Số tờ khai
+# - Mọi thao tác ghi đi qua writer thread của pool (pool.run_write / job) => group commit giữa các session
+# - Import Logistics / Add Project Import: nhiều file / mọi sheet Excel cùng lúc (ghép theo thứ tự upload); CSV tự nhận encoding + dấu phân cách
+# - Perf panel (sidebar, tự bật): thời gian SQL / pandas / render của lần rerun hiện tại; APP_PERF_LOG=file => ghi JSON lines
 
 import streamlit as st
 import pandas as pd
-import sqlite3
-from sqlite3 import Connection
 from datetime import datetime
 import io
 import os
 
-st.set_page_config(page_title="Track hàng dự án", layout="wide")
+import db
+import perf
+from db import DB_PATH, ROLLUP_DIMS, get_latest_update_s4, gen_project_id
+from cache import QueryCache, UploadCache
+from export import EXPORT_FORMATS, export_path, export_projects
+from jobs import JobRunner, get_jobs, job_fraction, job_rate
+from status import count_bulk_matches, fetch_bulk_preview, log_status, update_pi
+from ingest import REJECT_COLUMNS, import_projects, parse_paste_text
+from queries import (
+    PROJECT_DISPLAY_COLUMNS, ROLLUP_WEEKS, count_projects, fetch_projects_page, fetch_rollup_dim, fetch_rollup_totals, fetch_status_history,
+    fetch_weekly_arrivals, page_count, search_projects,
+)
 
-DB_PATH = "data.db"
+st.set_page_config(page_title="Track hàng dự án", layout="wide")
 
 # ========= DB =========
-def get_conn() -> Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
-
-def init_db(conn: Connection):
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS projects(
-        project_id     TEXT PRIMARY KEY,
-        dgw_pic        TEXT NOT NULL,
-        asus_pic       TEXT NOT NULL,
-        partnumber     TEXT,               -- optional
-        sku_code       TEXT NOT NULL,      -- Mã hàng
-        qty            INTEGER NOT NULL,
-        price_vnd      REAL NOT NULL,
-        asus_order_email TEXT,             -- optional
-        si             TEXT NOT NULL,
-        eu             TEXT NOT NULL,
-        pi_no          TEXT,               -- có thể bổ sung/đổi qua Quick PI
-        bill_no        TEXT,
-        lot_no         TEXT,
-        declaration_no TEXT,
-        s4_in_warehouse_date TEXT,         -- dd/mm/yyyy
-        s4_arrival_port_date TEXT,         -- dd/mm/yyyy
-        s4_departure_date TEXT,            -- dd/mm/yyyy
-        row_created_at TEXT NOT NULL
-    );
-    """)
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS status_logs(
-        log_id      INTEGER PRIMARY KEY AUTOINCREMENT,
-        project_id  TEXT NOT NULL,
-        status_text TEXT NOT NULL,
-        note        TEXT,
-        updated_by  TEXT NOT NULL,
-        updated_at  TEXT NOT NULL,
-        FOREIGN KEY(project_id) REFERENCES projects(project_id) ON DELETE CASCADE
-    );
-    """)
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS settings(
-        key   TEXT PRIMARY KEY,
-        value TEXT
-    );
-    """)
-    conn.commit()
-
-def get_latest_update_s4(conn: Connection) -> str | None:
-    cur = conn.execute("SELECT value FROM settings WHERE key='latest_update_s4'")
-    row = cur.fetchone()
-    return row[0] if row else None
-
-def set_latest_update_s4(conn: Connection, ts_str: str):
-    conn.execute("INSERT INTO settings(key,value) VALUES('latest_update_s4', ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (ts_str,))
-    conn.commit()
-
-def gen_project_id(conn: Connection) -> str:
-    cur = conn.execute("SELECT COUNT(*) FROM projects")
-    n = cur.fetchone()[0] + 1
-    return f"PJT-{n:05d}"
+# Pool dùng chung mọi rerun/session: schema + PRAGMA chỉ chạy 1 lần / process
+@st.cache_resource
+def get_pool() -> db.ConnectionPool:
+    return db.ConnectionPool(DB_PATH)
+
+# Cache parse file upload (key = hash nội dung), dùng chung mọi session
+@st.cache_resource
+def get_upload_cache() -> UploadCache:
+    return UploadCache()
+
+# Cache kết quả đọc (Tab 1, Quick PI, C1, C2) dùng chung mọi session; hết hạn khi có ghi DB
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    return QueryCache(get_pool())
+
+# Job nền (import file, bulk status): 1 runner / process; job dở dang của lần chạy trước => chạy tiếp
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    runner = JobRunner(get_pool())
+    runner.resume_pending()
+    return runner
 
 # ========= Helpers =========
-REQUIRED_ADD_FIELDS = ["dgw_pic","asus_pic","sku_code","qty","price_vnd","si","eu"]  # bắt buộc
-OPTIONAL_ADD_FIELDS = ["partnumber","asus_order_email"]
-
-# chuẩn hóa ngày: input có thể dd/mm/yyyy hoặc yyyy-mm-dd -> output dd/mm/yyyy
-def normalize_date_cell(val) -> str | None:
-    if val is None: return None
-    if isinstance(val, float) and pd.isna(val): return None
-    s = str(val).strip()
-    if s == "" or s.lower() in {"nan","nat","none"}:
-        return None
-    # cố parse
-    try:
-        if "-" in s:
-            # yyyy-mm-dd (hoặc ISO)
-            dt = pd.to_datetime(s, errors="coerce")
-            if pd.isna(dt): return None
-            return dt.strftime("%d/%m/%Y")
-        elif "/" in s:
-            # dd/mm/yyyy có thể
-            # pandas thông minh đủ, chúng ta ép dayfirst
-            dt = pd.to_datetime(s, dayfirst=True, errors="coerce")
-            if pd.isna(dt): return None
-            return dt.strftime("%d/%m/%Y")
-        else:
-            # Excel serial?
-            dt = pd.to_datetime(s, errors="coerce", unit="D", origin="1899-12-30")
-            if pd.isna(dt):
-                return None
-            return dt.strftime("%d/%m/%Y")
-    except Exception:
+def project_picker(key: str) -> str | None:
+    # tìm server-side (LIMIT nhỏ) thay vì selectbox cả bảng; trả về project_id đã chọn
+    kw = st.text_input("Tìm dự án (Project ID, Mã hàng, Partnumber, PI)", key=f"{key}_q")
+    opts = get_query_cache().call(search_projects, kw)
+    if len(opts) == 0:
+        st.info("Không tìm thấy dự án." if kw.strip() else "Chưa có dự án.")
         return None
+    labels = dict(zip(opts["project_id"], opts["label"]))
+    return st.selectbox("Chọn dự án", options=list(labels), format_func=labels.get, key=key)
+
+JOB_POLL_S = 1.0
+
+def render_job(job: dict):
+    if job["status"] in ("queued", "running"):
+        name = job["source_name"] or "Bulk status"
+        total = job["total_rows"] if job["total_rows"] is not None else "?"
+        st.progress(job_fraction(job), text=f"{name}: {job['done_rows']}/{total} dòng — {job_rate(job):,.0f} dòng/s")
+    elif job["status"] == "error":
+        st.error(f"Lỗi file/import: {job['message']}")
+        if st.button("Chạy tiếp", key=f"job_resume_{job['job_id']}"):
+            get_job_runner().resume(job["job_id"])
+            st.rerun()
+    elif job["kind"] == "logistics":
+        st.success("Import thành công. (Đã cập nhật 'Latest update S4')")
+    elif job["kind"] == "projects":
+        res = job["result"]
+        st.success(f"Đã tạo {res.get('created', 0)} dự án. Bỏ qua {res.get('rejected', 0)} dòng không hợp lệ.")
+        if res.get("rejected_rows"):
+            st.dataframe(pd.DataFrame(res["rejected_rows"], columns=REJECT_COLUMNS),
+                         use_container_width=True, hide_index=True)
+    else:
+        st.success(f"Đã ghi trạng thái cho {job['result'].get('logged', 0)} dự án.")
+
+@st.fragment(run_every=JOB_POLL_S)
+def job_progress(job_id: int):
+    # chỉ fragment này rerun mỗi giây; phần còn lại của trang vẫn dùng bình thường
+    with get_pool().read() as conn:
+        job = get_jobs(conn, [job_id])[0]
+    if job["status"] in ("queued", "running"):
+        render_job(job)
+    else:
+        st.rerun()    # xong => rerun cả trang (Tab 1 thấy dữ liệu mới, ngừng poll)
+
+def job_panel(key: str):
+    # job gần nhất của session cho khu vực này (session_state[key] = job_id)
+    job_id = st.session_state.get(key)
+    if job_id is None:
+        return
+    with get_pool().read() as conn:
+        jobs = get_jobs(conn, [job_id])
+    if not jobs:
+        return
+    if jobs[0]["status"] in ("queued", "running"):
+        job_progress(job_id)
+    else:
+        render_job(jobs[0])
 
-def contains_like(series: pd.Series, keyword: str) -> pd.Series:
-    if keyword is None or str(keyword).strip() == "":
-        return pd.Series([True]*len(series), index=series.index)
-    return series.fillna("").str.contains(str(keyword).strip(), case=False, na=False)
-
-# đọc file CSV/XLSX an toàn
-def read_any_table(uploaded) -> pd.DataFrame:
-    name = uploaded.name.lower()
-    if name.endswith(".csv"):
-        return pd.read_csv(uploaded)
-    return pd.read_excel(uploaded)
-
-# === Mapping Import Logistics (LOCKED) ===
-# PI: Hợp đồng/ Số PO NK
-# Bill: Bill of lading
-# S4_Arrival_Port_Date: Ngày đến cảng
-# S4_In_Warehouse_Date: Ngày đến kho
-# S4_Departure_Date: Ngày khởi hành
-# Declaration_No: Số tờ khai
-# Lot_No: Số lô
-
-def map_import_logistics_columns(df: pd.DataFrame) -> pd.DataFrame:
-    colmap = {}
-    # chuẩn hoá tiêu đề: strip + lower để map dễ
-    lower_cols = {c: str(c).strip().lower() for c in df.columns}
-    def find_col(*cands):
-        # trả về tên cột gốc nếu trùng một trong các ứng viên (lower)
-        cands_l = [c.lower() for c in cands]
-        for orig, low in lower_cols.items():
-            if low in cands_l:
-                return orig
-        return None
+PERF_KIND_LABELS = {"query": "Query", "cache": "Cache hit", "sql": "SQL", "fetch": "SQL fetch",
+                    "pandas": "pandas", "parse": "Parse", "import": "Import", "render": "Render"}
+
+def perf_panel(rec: perf.Recorder):
+    # breakdown của lần rerun vừa xong (stage lồng nhau => các dòng không cộng dồn được)
+    n_sql = sum(e[0] == "sql" for e in rec.events)
+    st.sidebar.markdown("**Perf — lần chạy này**")
+    st.sidebar.caption(f"Tổng {rec.seconds * 1000:,.0f} ms — SQL {rec.total_ms('sql') + rec.total_ms('fetch'):,.1f} ms ({n_sql} câu)")
+    df = pd.DataFrame(rec.summary(), columns=["kind", "name", "calls", "ms", "rows", "rows_per_s"])
+    df["kind"] = df["kind"].map(PERF_KIND_LABELS).fillna(df["kind"])
+    df.columns = ["Loại", "Bước", "Lần", "ms", "Dòng", "Dòng/s"]
+    st.sidebar.dataframe(df, use_container_width=True, hide_index=True)
+
+def date_range(value) -> tuple:
+    # st.date_input range: () | (từ,) khi đang chọn | (từ, đến)
+    value = tuple(value) if isinstance(value, (list, tuple)) else (value,)
+    start = value[0] if len(value) > 0 else None
+    end = value[1] if len(value) > 1 else None
+    return start, end
 
-    col_pi = find_col("hợp đồng/ số po nk","hop dong/ so po nk","hop dong / so po nk","so po nk","pi","số pi","pi no")
-    col_bill = find_col("bill of lading","bill","vận đơn")
-    col_arrival = find_col("ngày đến cảng","ngay den cang","s4_arrival_port_date")
-    col_inwh = find_col("ngày đến kho","ngay den kho","s4_in_warehouse_date")
-    col_depart = find_col("ngày khởi hành","ngay khoi hanh","s4_departure_date")
-    col_decl = find_col("số tờ khai","so to khai","declaration_no")
-    col_lot = find_col("số lô","so lo","lot_no")
-
-    # tạo df chuẩn với các cột chính (có thể None)
-    out = pd.DataFrame()
-    out["PI"] = df[col_pi] if col_pi else None
-    out["Bill"] = df[col_bill] if col_bill else None
-    out["S4_Arrival_Port_Date"] = df[col_arrival] if col_arrival else None
-    out["S4_In_Warehouse_Date"] = df[col_inwh] if col_inwh else None
-    out["S4_Departure_Date"] = df[col_depart] if col_depart else None
-    out["Declaration_No"] = df[col_decl] if col_decl else None
-    out["Lot_No"] = df[col_lot] if col_lot else None
-    return out
-
-def normalize_string(x):
-    if x is None: return None
-    s = str(x).strip()
-    return s if s != "" else None
 
 # ========= UI =========
+PAGE_SIZES = [50, 100, 200, 500]
+
 st.title("Track hàng dự án — MVP")
 
 # Role (demo)
 role = st.sidebar.selectbox("Role", ["Viewer","Editor"], index=0)
 st.sidebar.caption("Tab 2 & Tab 3 chỉ hiện khi Role = Editor")
+perf_on = st.sidebar.toggle("Perf panel", key="perf_panel", help="Đo thời gian SQL / pandas / render của mỗi lần chạy")
+# chỉ đo khi bật panel hoặc có APP_PERF_LOG; tắt => không tạo Recorder (chi phí ~0)
+# Streamlit dùng lại context của script thread giữa các rerun; lần chạy trước bị ngắt (st.rerun, widget đổi,
+# exception) không tới perf.finish => gỡ Recorder cũ, không thì nó ghi mãi kể cả khi tắt panel
+perf.reset()
+perf_rec = perf.start("rerun", role=role) if perf_on or perf.PERF_LOG else None
 
 # ---------- Tab 1: Projects ----------
-conn = get_conn()
-init_db(conn)
+pool = get_pool()
+qcache = get_query_cache()
+get_job_runner()    # khởi động runner ngay lần chạy đầu => job dở dang của process trước chạy tiếp
 
-tab1, tab2, tab3 = st.tabs(["Projects","Add Project (Editor)","Editor Tools (Editor)"])
+tab1, tab_sum, tab2, tab3 = st.tabs(["Projects","Summary","Add Project (Editor)","Editor Tools (Editor)"])
 
 with tab1:
     # Header: Latest update S4
-    latest_s4 = get_latest_update_s4(conn)
+    latest_s4 = qcache.call(get_latest_update_s4)
     if latest_s4:
         st.markdown(f"**Latest update S4:** {latest_s4}")
     else:
@@ -199,6 +171,7 @@ with tab1:
 
     # Filters (tối giản, theo spec không yêu cầu cụ thể; vẫn hữu ích)
     st.subheader("Projects")
+    f_all = st.text_input("Tìm tất cả (SI, EU, PIC, Mã hàng, Partnumber, PI, Số lô, Bill, Số tờ khai)")
     c1, c2, c3, c4, c5 = st.columns(5)
     f_si = c1.text_input("Lọc: SI")
     f_eu = c2.text_input("EU")
@@ -211,59 +184,106 @@ with tab1:
     f_lot = c8.text_input("Số lô")
     f_bill = c9.text_input("Bill")
     f_decl = c10.text_input("Số tờ khai")
-    # (Theo spec: date range theo S4 đến kho không bắt buộc; có thể bổ sung sau nếu cần)
-
-    df = pd.read_sql_query("SELECT * FROM projects", conn)
-
-    if len(df)==0:
+    f_status = c11.text_input("Current status")
+    # Khoảng ngày S4 (lọc trong SQL theo cột ISO có index; hiển thị vẫn dd/mm/yyyy)
+    c12, c13, c14 = st.columns(3)
+    d_wh = c12.date_input("S4 đến kho (từ - đến)", value=(), format="DD/MM/YYYY")
+    d_port = c13.date_input("S4 cập cảng (từ - đến)", value=(), format="DD/MM/YYYY")
+    d_dep = c14.date_input("S4 đi (từ - đến)", value=(), format="DD/MM/YYYY")
+
+    filters = {
+        "si": f_si, "eu": f_eu, "dgw_pic": f_dgw, "asus_pic": f_asus, "sku_code": f_sku,
+        "partnumber": f_pn, "pi_no": f_pi, "lot_no": f_lot, "bill_no": f_bill, "declaration_no": f_decl,
+        "current_status": f_status,
+    }
+    dates = {
+        col: rng for col, rng in (
+            ("s4_in_warehouse_date", date_range(d_wh)),
+            ("s4_arrival_port_date", date_range(d_port)),
+            ("s4_departure_date", date_range(d_dep)),
+        ) if rng != (None, None)
+    }
+    # filter đổi => quay về trang 1
+    if st.session_state.get("_proj_filters") != (filters, f_all, dates):
+        st.session_state["_proj_filters"] = (filters, f_all, dates)
+        st.session_state["proj_page"] = 1
+
+    # Column order locked
+    # 1) SI | 2) EU | 3) DGW PIC | 4) Asus PIC | 5) Last updated (-> row_created_at tạm xem như last created/updated field ở MVP, vì spec yêu cầu không cập nhật per-row)
+    # 6) Mã hàng | 7) Partnumber | 8) Qty | 9) Giá | 10) PI | 11) Số lô | 12) Bill | 13) Số tờ khai | 14) S4 đến kho | 15) S4 cập cảng | 16) S4 đi
+    # 17) Current status (log mới nhất, bảng project_current_status)
+    # Filter + sort (Last updated mới -> cũ) + phân trang chạy trong SQL; chỉ fetch đúng trang đang xem
+    total = qcache.call(count_projects, filters, search=f_all, dates=dates)
+    has_filter = any(str(v).strip() for v in filters.values()) or f_all.strip() != "" or bool(dates)
+    if total == 0 and not has_filter:
         st.info("Chưa có dữ liệu.")
     else:
-        # Column order locked
-        # 1) SI | 2) EU | 3) DGW PIC | 4) Asus PIC | 5) Last updated (-> row_created_at tạm xem như last created/updated field ở MVP, vì spec yêu cầu không cập nhật per-row)
-        # 6) Mã hàng | 7) Partnumber | 8) Qty | 9) Giá | 10) PI | 11) Số lô | 12) Bill | 13) Số tờ khai | 14) S4 đến kho | 15) S4 cập cảng | 16) S4 đi
-        # Ta sẽ hiển thị "Last updated" = row_created_at (vì spec không cập nhật per-project khi import).
-        df_display = pd.DataFrame({
-            "SI": df["si"],
-            "EU": df["eu"],
-            "DGW PIC": df["dgw_pic"],
-            "Asus PIC": df["asus_pic"],
-            "Last updated": df["row_created_at"],
-            "Mã hàng": df["sku_code"],
-            "Partnumber": df["partnumber"],
-            "Qty": df["qty"],
-            "Giá": df["price_vnd"],
-            "PI": df["pi_no"],
-            "Số lô": df["lot_no"],
-            "Bill": df["bill_no"],
-            "Số tờ khai": df["declaration_no"],
-            "S4 đến kho": df["s4_in_warehouse_date"],
-            "S4 cập cảng": df["s4_arrival_port_date"],
-            "S4 đi": df["s4_departure_date"],
-        })
-
-        # Apply filters
-        ok = (
-            contains_like(df_display["SI"], f_si) &
-            contains_like(df_display["EU"], f_eu) &
-            contains_like(df_display["DGW PIC"], f_dgw) &
-            contains_like(df_display["Asus PIC"], f_asus) &
-            contains_like(df_display["Mã hàng"], f_sku) &
-            contains_like(df_display["Partnumber"], f_pn) &
-            contains_like(df_display["PI"], f_pi) &
-            contains_like(df_display["Số lô"], f_lot) &
-            contains_like(df_display["Bill"], f_bill) &
-            contains_like(df_display["Số tờ khai"], f_decl)
-        )
-        out = df_display[ok].copy()
-
-        # Sort mặc định: Last updated (mới -> cũ) — với dữ liệu MVP, row_created_at làm proxy
-        try:
-            out["_sort"] = pd.to_datetime(out["Last updated"], errors="coerce")
-        except Exception:
-            out["_sort"] = pd.NaT
-        out = out.sort_values("_sort", ascending=False).drop(columns=["_sort"])
-
-        st.dataframe(out, use_container_width=True, height=540)
+        p1, p2, p3 = st.columns([1, 1, 4])
+        page_size = p1.selectbox("Dòng / trang", PAGE_SIZES, index=1, key="proj_page_size")
+        n_pages = page_count(total, page_size)
+        if st.session_state.get("proj_page", 1) > n_pages:
+            st.session_state["proj_page"] = n_pages
+        page = p2.number_input("Trang", min_value=1, max_value=n_pages, step=1, key="proj_page")
+        p3.caption(f"{total} dòng — trang {page}/{n_pages}")
+        out = qcache.call(fetch_projects_page, filters, page=page, page_size=page_size, search=f_all, dates=dates)
+        # chọn 1 dòng => mới load lịch sử trạng thái của dự án đó
+        with perf.stage("render", "projects table", len(out)):
+            event = st.dataframe(out, use_container_width=True, height=540,
+                                 on_select="rerun", selection_mode="single-row", key="proj_table")
+        sel_rows = [i for i in event.selection.rows if i < len(out)]
+        if sel_rows:
+            pid = out.index[sel_rows[0]]
+            st.markdown(f"**Lịch sử trạng thái — {pid}**")
+            hist = qcache.call(fetch_status_history, pid)
+            if len(hist) == 0:
+                st.caption("Chưa có log trạng thái.")
+            else:
+                st.dataframe(hist, use_container_width=True, hide_index=True)
+
+        # Export toàn bộ kết quả filter (không chỉ trang đang xem): stream từ SQLite ra file, rồi mới cho tải
+        e1, e2, e3 = st.columns([1, 1, 4])
+        for fmt, col in (("csv", e1), ("xlsx", e2)):
+            if col.button(f"Xuất {fmt.upper()}", key=f"proj_export_{fmt}", disabled=total == 0):
+                old = st.session_state.pop("proj_export", None)
+                if old and os.path.exists(old[0]):
+                    os.remove(old[0])    # 1 file export / session
+                path = export_path(fmt)
+                with pool.read() as conn:
+                    n = export_projects(conn, fmt, path, filters, search=f_all, dates=dates)
+                st.session_state["proj_export"] = (path, fmt, n, (filters, f_all, dates))
+        exp = st.session_state.get("proj_export")
+        if exp and exp[3] == (filters, f_all, dates) and os.path.exists(exp[0]):
+            path, fmt, n, _ = exp
+
+            def read_export() -> bytes:
+                with open(path, "rb") as f:
+                    return f.read()
+            # callable => chỉ đọc file khi bấm tải; rerun khác (phân trang, chọn dòng...) không nạp lại file lớn
+            e3.download_button(f"Tải {fmt.upper()} ({n} dòng)", read_export, file_name=f"projects.{fmt}",
+                               mime=EXPORT_FORMATS[fmt], key="proj_export_dl")
+
+# ---------- Summary ----------
+# chỉ đọc bảng rollup (trigger giữ sẵn) => thời gian không đổi theo số dòng projects
+with tab_sum:
+    st.subheader("Summary")
+    totals = qcache.call(fetch_rollup_totals)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Số dòng", f"{totals['n_lines']:,}")
+    m2.metric("Tổng Qty", f"{totals['qty']:,}")
+    m3.metric("Tổng giá trị (VND)", f"{totals['value_vnd']:,.0f}")
+
+    dim = st.radio("Tổng theo", ROLLUP_DIMS, horizontal=True, key="sum_dim", format_func=PROJECT_DISPLAY_COLUMNS.get)
+    st.dataframe(qcache.call(fetch_rollup_dim, dim), use_container_width=True, hide_index=True)
+
+    st.markdown("**Số dòng đến cảng / đến kho theo tuần** (theo ngày S4)")
+    all_weeks = st.checkbox(f"Tất cả các tuần (mặc định {ROLLUP_WEEKS} tuần gần nhất)", key="sum_all_weeks")
+    weekly = qcache.call(fetch_weekly_arrivals, None if all_weeks else ROLLUP_WEEKS)
+    if len(weekly) == 0:
+        st.caption("Chưa có ngày S4.")
+    else:
+        st.line_chart(weekly)
+        with st.expander("Bảng số liệu theo tuần"):
+            st.dataframe(weekly, use_container_width=True)
 
 # ---------- Tab 2: Add Project ----------
 with tab2:
@@ -302,19 +322,23 @@ with tab2:
                 if any(v is None or (isinstance(v, str) and v == "") for v in req_vals.values()):
                     st.error("Thiếu 1 trong các trường bắt buộc.")
                 else:
-                    pid = gen_project_id(conn)
                     now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                    conn.execute("""
-                        INSERT INTO projects(project_id,dgw_pic,asus_pic,partnumber,sku_code,qty,price_vnd,asus_order_email,si,eu,pi_no,bill_no,lot_no,declaration_no,
-                                             s4_in_warehouse_date,s4_arrival_port_date,s4_departure_date,row_created_at)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    """, (
-                        pid, dgw_pic.strip(), asus_pic.strip(), partnumber.strip() or None,
-                        req_vals["sku_code"], req_vals["qty"], req_vals["price_vnd"],
-                        asus_order_email.strip() or None, req_vals["si"], req_vals["eu"],
-                        None, None, None, None, None, None, None, now
-                    ))
-                    conn.commit()
+
+                    def add_one(conn) -> str:
+                        pid = gen_project_id(conn)
+                        conn.execute("""
+                            INSERT INTO projects(project_id,dgw_pic,asus_pic,partnumber,sku_code,qty,price_vnd,asus_order_email,si,eu,pi_no,bill_no,lot_no,declaration_no,
+                                                 s4_in_warehouse_date,s4_arrival_port_date,s4_departure_date,row_created_at)
+                            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                        """, (
+                            pid, dgw_pic.strip(), asus_pic.strip(), partnumber.strip() or None,
+                            req_vals["sku_code"], req_vals["qty"], req_vals["price_vnd"],
+                            asus_order_email.strip() or None, req_vals["si"], req_vals["eu"],
+                            None, None, None, None, None, None, None, now
+                        ))
+                        return pid
+                    # qua writer thread: gộp commit với thao tác ghi của các session khác
+                    pid = pool.run_write(add_one)
                     st.success(f"Đã tạo {pid}")
 
         st.divider()
@@ -326,124 +350,45 @@ with tab2:
             if not txt.strip():
                 st.warning("Không có dữ liệu.")
             else:
-                # tách dòng
-                lines = [ln for ln in txt.strip().splitlines() if ln.strip()!=""]
-                # nếu có header: phát hiện bằng cách thử parse số lượng (cột 5)
-                created = 0
-                skipped = 0
-                for idx, line in enumerate(lines):
-                    parts = [p.strip() for p in (line.replace("\t",",")).split(",")]
-                    if len(parts) < 9:
-                        skipped += 1
-                        continue
-                    dgw_pic, asus_pic, partnumber, sku_code, qty, price_vnd, asus_ord_mail, si, eu = parts[:9]
-                    # bỏ qua dòng header nếu cột qty không phải số
-                    if idx == 0:
-                        try:
-                            _ = float(qty)
-                        except:
-                            # có header -> skip dòng này
-                            continue
-                    # validate bắt buộc
-                    if any([not dgw_pic, not asus_pic, not sku_code, not qty, not price_vnd, not si, not eu]):
-                        skipped += 1
-                        continue
-                    try:
-                        qty_i = int(float(qty))
-                        price_f = float(price_vnd)
-                    except:
-                        skipped += 1
-                        continue
-                    pid = gen_project_id(conn)
-                    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                    conn.execute("""
-                        INSERT INTO projects(project_id,dgw_pic,asus_pic,partnumber,sku_code,qty,price_vnd,asus_order_email,si,eu,pi_no,bill_no,lot_no,declaration_no,
-                                             s4_in_warehouse_date,s4_arrival_port_date,s4_departure_date,row_created_at)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    """, (
-                        pid, dgw_pic, asus_pic, (partnumber or None),
-                        sku_code.upper(), qty_i, price_f, (asus_ord_mail or None),
-                        si, eu, None, None, None, None, None, None, None, now
-                    ))
-                    created += 1
-                conn.commit()
-                st.success(f"Đã thêm {created} dòng. Bỏ qua {skipped} dòng không hợp lệ.")
+                # tách dòng + bỏ header, validate theo cột, ghi 1 transaction
+                df_paste, rej_paste = parse_paste_text(txt)
+                created, rej_valid = pool.run_write(import_projects, df_paste)
+                rejected = pd.concat([rej_paste, rej_valid], ignore_index=True).sort_values("Dòng")
+                st.success(f"Đã thêm {len(created)} dòng. Bỏ qua {len(rejected)} dòng không hợp lệ.")
+                if len(rejected):
+                    st.dataframe(rejected, use_container_width=True, hide_index=True)
 
         st.divider()
         st.subheader("Add Project — Import (CSV/XLSX)")
         st.caption("Header VN hoặc EN, thứ tự/hoa thường không bắt buộc. Bắt buộc có: DGW PIC, ASUS PIC, Mã hàng, Số lượng, Đơn giá FV, SI, EU")
-        up = st.file_uploader("Chọn file", type=["csv","xlsx"], key="addproj")
-        if up:
+        ups = st.file_uploader("Chọn file (có thể chọn nhiều)", type=["csv","xlsx"], key="addproj",
+                               accept_multiple_files=True)
+        all_sheets = st.checkbox("Đọc tất cả sheet của file Excel", key="addproj_sheets")
+        if ups:
             try:
-                df_imp = read_any_table(up)
-                # chuẩn hóa header: strip lower để map
-                cols_lower = {c: str(c).strip().lower() for c in df_imp.columns}
-                def pick(*cand):
-                    cl = [c.lower() for c in cand]
-                    for orig, low in cols_lower.items():
-                        if low in cl:
-                            return orig
-                    return None
-                c_dgw = pick("dgw pic","dgw_pic")
-                c_asus = pick("asus pic","asus_pic")
-                c_pn = pick("part number","partnumber")
-                c_sku = pick("mã hàng","ma hang","sku_code","sku")
-                c_qty = pick("số lượng","so luong","qty","quantity")
-                c_price = pick("đơn giá fv","don gia fv","price_vnd","price","unit price","gia")
-                c_mail = pick("mail nhận đơn hàng từ asus","mail nhan don hang tu asus","asus_order_email","order email")
-                c_si = pick("si")
-                c_eu = pick("eu")
-
-                need_cols = [c_dgw, c_asus, c_sku, c_qty, c_price, c_si, c_eu]
-                if any(x is None for x in need_cols):
-                    st.error("Thiếu cột bắt buộc trong file import.")
+                # 1 file / sheet đầu: parse + map 1 lần / file (cache theo hash nội dung); index = số dòng theo file
+                # nhiều file / mọi sheet: ghép theo thứ tự upload, cột "Nguồn" => dòng bị loại ghi kèm file / sheet
+                single = len(ups) == 1 and not all_sheets
+                if single:
+                    parsed = get_upload_cache().get_parsed(ups[0], "projects")
                 else:
-                    df_use = pd.DataFrame({
-                        "dgw_pic": df_imp[c_dgw],
-                        "asus_pic": df_imp[c_asus],
-                        "partnumber": df_imp[c_pn] if c_pn else None,
-                        "sku_code": df_imp[c_sku],
-                        "qty": df_imp[c_qty],
-                        "price_vnd": df_imp[c_price],
-                        "asus_order_email": df_imp[c_mail] if c_mail else None,
-                        "si": df_imp[c_si],
-                        "eu": df_imp[c_eu],
-                    })
-                    # preview
-                    st.dataframe(df_use.head(20), use_container_width=True, height=280)
-                    if st.button("Run Import Projects"):
-                        created = 0
-                        skipped = 0
-                        for _, r in df_use.iterrows():
-                            try:
-                                dgw_pic = str(r["dgw_pic"]).strip()
-                                asus_pic = str(r["asus_pic"]).strip()
-                                sku_code = str(r["sku_code"]).strip().upper()
-                                qty_i = int(float(r["qty"]))
-                                price_f = float(r["price_vnd"])
-                                si = str(r["si"]).strip()
-                                eu = str(r["eu"]).strip()
-                                # validate
-                                if any([not dgw_pic, not asus_pic, not sku_code, qty_i<=0, price_f<0, not si, not eu]):
-                                    skipped += 1
-                                    continue
-                                partnumber = (None if pd.isna(r["partnumber"]) else str(r["partnumber"]).strip()) if "partnumber" in r else None
-                                mail = (None if pd.isna(r["asus_order_email"]) else str(r["asus_order_email"]).strip()) if "asus_order_email" in r else None
-                                pid = gen_project_id(conn)
-                                now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                                conn.execute("""
-                                    INSERT INTO projects(project_id,dgw_pic,asus_pic,partnumber,sku_code,qty,price_vnd,asus_order_email,si,eu,pi_no,bill_no,lot_no,declaration_no,
-                                                         s4_in_warehouse_date,s4_arrival_port_date,s4_departure_date,row_created_at)
-                                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                                """, (
-                                    pid, dgw_pic, asus_pic, partnumber, sku_code, qty_i, price_f,
-                                    mail, si, eu, None, None, None, None, None, None, None, now
-                                ))
-                                created += 1
-                            except Exception:
-                                skipped += 1
-                        conn.commit()
-                        st.success(f"Đã tạo {created} dự án. Bỏ qua {skipped} dòng không hợp lệ.")
+                    parsed = get_upload_cache().get_parsed_many(ups, "projects", all_sheets)
+                    st.caption(f"{parsed['rows']} dòng từ {len(ups)} file.")
+                st.dataframe(parsed["preview"], use_container_width=True, height=280)
+                if len(parsed["preview"]) == 0:
+                    st.warning("File không có dữ liệu.")
+                elif st.button("Run Import Projects"):
+                    # chạy nền theo chunk (file quá lớn để cache => job tự stream lại file)
+                    runner = get_job_runner()
+                    if single:
+                        job_id = runner.submit_file("projects", ups[0], parsed["frame"])
+                    else:
+                        job_id = runner.submit_files("projects", ups, all_sheets, parsed["frame"])
+                    st.session_state["job_projects"] = job_id
+
+            except Exception as e:
+                st.error(f"Lỗi file/import: {e}")
+        job_panel("job_projects")
 
 # ---------- Tab 3: Editor Tools ----------
 with tab3:
@@ -455,115 +400,63 @@ with tab3:
         # A) Quick PI
         with st.expander("A) Quick PI — cập nhật PI tức thời cho 1 dự án", expanded=False):
             # chọn dự án
-            dfp = pd.read_sql_query("SELECT project_id, sku_code, partnumber, pi_no FROM projects", conn)
-            if len(dfp)==0:
-                st.info("Chưa có dự án.")
-            else:
-                dfp["label"] = dfp.apply(lambda r: f"{r['project_id']} | {r['sku_code']} | {r['partnumber'] or ''} | PI={r['pi_no'] or '-'}", axis=1)
-                sel = st.selectbox("Chọn dự án", options=dfp["label"].tolist())
+            pid = project_picker("qpi_sel")
+            if pid is not None:
                 new_pi = st.text_input("Nhập PI *").strip().upper()
                 if st.button("Cập nhật PI"):
-                    pid = sel.split("|")[0].strip()
                     if new_pi == "":
                         st.error("PI không được rỗng.")
                     else:
-                        conn.execute("UPDATE projects SET pi_no=? WHERE project_id=?", (new_pi, pid))
-                        # ghi log trạng thái (append-only)
                         now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                        conn.execute("""
-                            INSERT INTO status_logs(project_id,status_text,note,updated_by,updated_at)
-                            VALUES (?,?,?,?,?)
-                        """, (pid, f"Confirmed PI ({new_pi})", "", "PM", now))
-                        conn.commit()
+                        # UPDATE PI + log trạng thái (append-only) trong cùng 1 transaction
+                        pool.run_write(update_pi, pid, new_pi, "PM", now)
                         st.success(f"Đã cập nhật PI cho {pid}")
 
         # B) Import Logistics
         with st.expander("B) Import Logistics — cập nhật S4/Bill/Tờ khai/Lô (match theo PI)", expanded=False):
-            up2 = st.file_uploader("Chọn file (CSV/XLSX) — cột sẽ auto-map đúng chuẩn đã lock", type=["csv","xlsx"], key="logimp")
-            if up2:
+            ups2 = st.file_uploader("Chọn file (CSV/XLSX) — cột sẽ auto-map đúng chuẩn đã lock; chọn được nhiều file",
+                                    type=["csv","xlsx"], key="logimp", accept_multiple_files=True)
+            all_sheets2 = st.checkbox("Đọc tất cả sheet của file Excel", key="logimp_sheets")
+            if ups2:
                 try:
-                    df_raw = read_any_table(up2)
-                    df_map = map_import_logistics_columns(df_raw)
-                    # preview gọn
-                    st.dataframe(df_map.head(20), use_container_width=True, height=300)
-                    if st.button("Run Import Logistics"):
-                        # duyệt tuần tự — duplicate PI: last-write-wins do ta ghi đè theo thứ tự dòng
-                        # ô trống không ghi đè
-                        # lấy danh sách project có PI
-                        dfp = pd.read_sql_query("SELECT project_id, pi_no FROM projects WHERE pi_no IS NOT NULL", conn)
-                        # index theo PI -> list project_id
-                        pi_groups = {}
-                        for _, r in dfp.iterrows():
-                            pi = str(r["pi_no"]).strip().upper()
-                            if not pi: continue
-                            pi_groups.setdefault(pi, []).append(r["project_id"])
-
-                        for _, r in df_map.iterrows():
-                            pi = normalize_string(r.get("PI"))
-                            if not pi:    # nếu không có PI -> bỏ qua (theo spec match theo PI)
-                                continue
-                            pi_u = pi.upper()
-                            target_ids = pi_groups.get(pi_u, [])
-                            if not target_ids:
-                                continue
-                            # chuẩn hoá giá trị update
-                            bill = normalize_string(r.get("Bill"))
-                            lot = normalize_string(r.get("Lot_No"))
-                            decl = normalize_string(r.get("Declaration_No"))
-                            d_in = normalize_date_cell(r.get("S4_In_Warehouse_Date"))
-                            d_arr = normalize_date_cell(r.get("S4_Arrival_Port_Date"))
-                            d_dep = normalize_date_cell(r.get("S4_Departure_Date"))
-                            for pid in target_ids:
-                                # build SET động, chỉ set khi có giá trị (ô trống không ghi đè)
-                                sets = []
-                                vals = []
-                                if bill is not None:
-                                    sets.append("bill_no=?"); vals.append(bill)
-                                if lot is not None:
-                                    sets.append("lot_no=?"); vals.append(lot)
-                                if decl is not None:
-                                    sets.append("declaration_no=?"); vals.append(decl)
-                                if d_in is not None:
-                                    sets.append("s4_in_warehouse_date=?"); vals.append(d_in)
-                                if d_arr is not None:
-                                    sets.append("s4_arrival_port_date=?"); vals.append(d_arr)
-                                if d_dep is not None:
-                                    sets.append("s4_departure_date=?"); vals.append(d_dep)
-                                if sets:
-                                    sql = f"UPDATE projects SET {', '.join(sets)} WHERE project_id=?"
-                                    vals.append(pid)
-                                    conn.execute(sql, tuple(vals))
-                        conn.commit()
-                        # chỉ cập nhật Latest update S4 (Tab 1 header)
-                        ts = datetime.now().strftime("%d-%m-%Y %H:%M")
-                        set_latest_update_s4(conn, ts)
-                        st.success("Import thành công. (Đã cập nhật 'Latest update S4')")
+                    # 1 file / sheet đầu: parse + map 1 lần / file (cache theo hash nội dung), file lớn => job stream lại
+                    # nhiều file / mọi sheet: đọc streaming, ghép theo thứ tự upload (file sau ghi đè file trước)
+                    single2 = len(ups2) == 1 and not all_sheets2
+                    if single2:
+                        parsed2 = get_upload_cache().get_parsed(ups2[0], "logistics")
+                    else:
+                        parsed2 = get_upload_cache().get_parsed_many(ups2, "logistics", all_sheets2)
+                        st.caption(f"{parsed2['rows']} dòng từ {len(ups2)} file.")
+                    st.dataframe(parsed2["preview"], use_container_width=True, height=300)
+                    if len(parsed2["preview"]) == 0:
+                        st.warning("File không có dữ liệu.")
+                    elif st.button("Run Import Logistics"):
+                        # chạy nền: merge set-based theo PI từng chunk — duplicate PI: last-write-wins; ô trống không ghi đè
+                        # xong => cập nhật Latest update S4 (Tab 1 header)
+                        runner = get_job_runner()
+                        if single2:
+                            job_id = runner.submit_file("logistics", ups2[0], parsed2["frame"])
+                        else:
+                            job_id = runner.submit_files("logistics", ups2, all_sheets2, parsed2["frame"])
+                        st.session_state["job_logistics"] = job_id
 
                 except Exception as e:
                     st.error(f"Lỗi file/import: {e}")
+            job_panel("job_logistics")
 
         # C) Status Update
         with st.expander("C) Status Update — By Project & Bulk", expanded=False):
             st.markdown("**C1) By Project**")
-            dfp = pd.read_sql_query("SELECT project_id, sku_code, partnumber FROM projects", conn)
-            if len(dfp)==0:
-                st.info("Chưa có dự án.")
-            else:
-                dfp["label"] = dfp.apply(lambda r: f"{r['project_id']} | {r['sku_code']} | {r['partnumber'] or ''}", axis=1)
-                sel1 = st.selectbox("Chọn dự án", options=dfp["label"].tolist(), key="st_one_sel")
+            pid1 = project_picker("st_one_sel")
+            if pid1 is not None:
                 stt = st.text_input("Status text *", key="st_one_text")
                 note = st.text_area("Note (optional)", height=80, key="st_one_note")
                 if st.button("Ghi trạng thái (1 dự án)"):
                     if not stt.strip():
                         st.error("Thiếu status text.")
                     else:
-                        pid = sel1.split("|")[0].strip()
                         now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                        conn.execute("""
-                            INSERT INTO status_logs(project_id,status_text,note,updated_by,updated_at)
-                            VALUES (?,?,?,?,?)
-                        """, (pid, stt.strip(), note.strip() or None, "PM", now))
-                        conn.commit()
+                        pool.run_write(log_status, pid1, stt.strip(), note.strip() or None, "PM", now)
                         st.success("Đã ghi log.")
 
             st.divider()
@@ -573,27 +466,27 @@ with tab3:
             f_lot = c2.text_input("Số lô (contains)", key="bulk_lot")
             f_decl = c3.text_input("Số tờ khai (contains)", key="bulk_decl")
 
-            d = pd.read_sql_query("SELECT project_id, sku_code, partnumber, bill_no, lot_no, declaration_no FROM projects", conn)
-            ok_mask = (
-                contains_like(d["bill_no"], f_bill) &
-                contains_like(d["lot_no"], f_lot) &
-                contains_like(d["declaration_no"], f_decl)
-            )
-            dsel = d[ok_mask].copy()
+            # filter contains đi qua index trigram (như Tab 1); chỉ COUNT + preview LIMIT, không load cả bảng
+            bulk_filters = {"bill_no": f_bill, "lot_no": f_lot, "declaration_no": f_decl}
+            n_match = qcache.call(count_bulk_matches, bulk_filters)
+            dsel = qcache.call(fetch_bulk_preview, bulk_filters)
+            st.caption(f"{n_match} dự án match" + (f" — xem trước {len(dsel)} dòng đầu" if n_match > len(dsel) else ""))
             st.dataframe(dsel, use_container_width=True, height=300)
             stt_all = st.text_input("Status text * (áp cho tất cả match)", key="bulk_text")
             note_all = st.text_area("Note (optional)", height=60, key="bulk_note")
             if st.button("Ghi trạng thái hàng loạt"):
                 if not stt_all.strip():
                     st.error("Thiếu status text.")
-                elif len(dsel)==0:
+                elif n_match==0:
                     st.warning("Không có dự án nào match.")
                 else:
-                    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                    for _, r in dsel.iterrows():
-                        conn.execute("""
-                            INSERT INTO status_logs(project_id,status_text,note,updated_by,updated_at)
-                            VALUES (?,?,?,?,?)
-                        """, (r["project_id"], stt_all.strip(), note_all.strip() or None, "PM", now))
-                    conn.commit()
-                    st.success(f"Đã ghi trạng thái cho {len(dsel)} dự án.")
+                    # chạy nền: INSERT ... SELECT theo từng chunk dự án (checkpoint theo rowid)
+                    st.session_state["job_bulk"] = get_job_runner().submit_bulk_status(
+                        bulk_filters, stt_all.strip(), note_all.strip() or None, "PM", total_rows=n_match)
+            job_panel("job_bulk")
+
+# ---------- Perf ----------
+if perf_rec is not None:
+    perf.finish(perf_rec)
+    if perf_on:
+        perf_panel(perf_rec)